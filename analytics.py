@@ -3,23 +3,127 @@
 
 import os
 import io
-import base64
+import bisect
+import cProfile
+import hashlib
+import itertools
+import json
+import multiprocessing
+import pstats
+import re
+import shutil
+import time
+import zlib
+import threading
+import numpy as np
 import pandas as pd
-from io import StringIO
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from flask import request, jsonify, abort, send_file
 from datetime import datetime
 from functools import lru_cache
-from dash import Dash, html, dcc, dash_table, Input, Output, State, callback_context
-import plotly.express as px
+from dash import (Dash, html, dcc, dash_table, Input, Output, State, Patch, ClientsideFunction,
+                  callback_context, no_update)
 import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.colors import get_colorscale
+import dash._callback as dash_callback
 import dash_bootstrap_components as dbc
 
+from cleaning import concat_pieces, piece_rows, read_sheets
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalescência de exportações só dentro do processo
+    fcntl = None
+
 # ----------------- Configurações -----------------
-EXPECTED_COLS = [
-    "Descricao", "Col2", "Col3", "Col4", "Interessado",
-    "Nr_Processo", "Abertura", "Tipo", "Setor", "Situacao"
-]
 LOCAL_XLSX = "rptProcAdm.xlsx"
 
+# Cache persistente de datasets limpos (incrementar CLEANER_VERSION ao mudar a limpeza)
+CACHE_DIR = os.environ.get("ANALYTICS_CACHE_DIR", ".cache")
+CLEANER_VERSION = 3
+
+# Datasets em arquivos .npy mapeados em memória e compartilhados entre os workers
+# do gunicorn (aponte para /dev/shm para mantê-los em memória compartilhada)
+DATASET_DIR = os.environ.get("ANALYTICS_DATASET_DIR") or os.path.join(CACHE_DIR, "datasets")
+# Orçamento dos datasets em disco (em /dev/shm, é RAM): os sem uso há mais de
+# DATASET_DISK_TTL e, acima do limite, os mais antigos são removidos; o dataset
+# base e os registrados no worker nunca são
+DATASET_DISK_TTL = int(os.environ.get("DATASET_DISK_TTL", 7 * 24 * 3600))
+DATASET_DISK_MAX_BYTES = int(os.environ.get("DATASET_DISK_MAX_BYTES", 1024 * 1024 * 1024))
+DATASET_TOUCH_SECONDS = 60  # intervalo mínimo entre marcações de uso do diretório
+
+# Upload em partes (rota /upload)
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 500 * 1024 * 1024))
+UPLOAD_STALE_SECONDS = 24 * 3600
+UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+# Cache de exportações em disco: validade e orçamento total
+EXPORT_CACHE_TTL = int(os.environ.get("EXPORT_CACHE_TTL", 3600))
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get("EXPORT_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+EXPORT_LOCK_STRIPES = 64
+DATASET_ID_RE = re.compile(r"^[0-9a-f]{20}$")
+
+# Ingestão em segundo plano (progresso publicado a cada PROGRESS_EVERY linhas,
+# definido em cleaning.py)
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 2))
+# Batimento dos jobs: o worker regrava o estado a cada INGEST_HEARTBEAT_SECONDS;
+# sem batimento há INGEST_STALE_SECONDS, o job é de um worker morto
+INGEST_HEARTBEAT_SECONDS = 5
+INGEST_STALE_SECONDS = int(os.environ.get("INGEST_STALE_SECONDS", 60))
+# Processos para ler várias planilhas em paralelo (upload de múltiplos arquivos)
+INGEST_PROCESSES = int(os.environ.get("INGEST_PROCESSES", min(4, os.cpu_count() or 1)))
+# Abaixo deste volume (fora o maior arquivo) subir os processos custa mais que ler em série
+INGEST_PARALLEL_MIN_BYTES = int(os.environ.get("INGEST_PARALLEL_MIN_BYTES", 1024 * 1024))
+DIMENSIONS = ["Setor", "Tipo", "Situacao"]
+
+# Registro de datasets em memória (o navegador guarda apenas o ID)
+DATASET_CACHE_MAX_BYTES = int(os.environ.get("DATASET_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+DATASET_CACHE_MAX_ITEMS = int(os.environ.get("DATASET_CACHE_MAX_ITEMS", 16))
+FIGURE_CACHE_SIZE = int(os.environ.get("FIGURE_CACHE_SIZE", 256))
+TABLE_PAGE_SIZE = 15
+# Modo clientside: cubos com até este número de células vão para o navegador e
+# KPIs, total e tabela são calculados em JavaScript (0 desativa)
+CLIENTSIDE_MAX_CELLS = int(os.environ.get("CLIENTSIDE_MAX_CELLS", 5000))
+
+# Instrumentação: fases por callback, rota /metrics e cabeçalho Server-Timing
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+# Cada worker do gunicorn grava um retrato das suas métricas em METRICS_DIR (no
+# máximo a cada METRICS_FLUSH_SECONDS) e o /metrics soma os de todos os workers
+METRICS_DIR = os.environ.get("METRICS_DIR") or os.path.join(CACHE_DIR, "metrics")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 1))
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+# Perfil sob demanda: com PROFILE_DIR definido, requisições com o cabeçalho
+# X-Profile: 1 ou ?profile=1 são perfiladas com cProfile e gravadas nesse diretório
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+PROFILE_TOP = 40    # funções no resumo .txt que acompanha cada .prof
+
+# Gráficos: coluna de totais na view, escala de cores e mensagem sem dados
+CHARTS = {
+    "Situacao": ("por_situacao", "Viridis", "Sem dados para situações"),
+    "Tipo": ("por_tipo", "Plasma", "Sem dados para tipos"),
+    "Setor": ("por_setor", "Turbo", "Sem dados para setores"),
+}
+
+# Templates e escalas resolvidos uma única vez e compartilhados por todas as figuras
+CHART_TEMPLATES = {
+    False: pio.templates["plotly_white"].to_plotly_json(),
+    True: pio.templates["plotly_dark"].to_plotly_json(),
+}
+CHART_SCALES = {dim: get_colorscale(scale) for dim, (_, scale, _) in CHARTS.items()}
+CHART_LAYOUT = {
+    "height": 380,
+    "margin": {"l": 10, "r": 10, "t": 10, "b": 10},
+    "showlegend": False,
+    "barmode": "relative",
+    "font": {"family": "Inter"},
+    "legend": {"tracegroupgap": 0},
+}
+GRAPH_CONFIG = {"displayModeBar": False, "responsive": True}
+
+
 COLORS = {
     "primary": "#6366f1",
     "secondary": "#8b5cf6", 
@@ -271,7 +375,8 @@ body {
     cursor: pointer;
 }
 
-.upload-area:hover {
+.upload-area:hover,
+.upload-area.dragover {
     border-color: rgba(99, 102, 241, 0.6);
     background: rgba(99, 102, 241, 0.05);
     transform: scale(1.01);
@@ -313,75 +418,472 @@ body {
 }
 """
 
-# -------------- Funções Otimizadas --------------
-@lru_cache(maxsize=32)
-def clean_excel_cached(file_path: str) -> pd.DataFrame:
-    """Versão cacheada da limpeza"""
-    try:
-        if os.path.exists(file_path):
-            xls = pd.ExcelFile(file_path)
-            return clean_excel(xls)
-    except:
-        pass
-    return pd.DataFrame(columns=["Tipo","Setor","Situacao"])
+# Upload em partes: o arquivo vai em blocos binários para /upload, sem base64
+# nem passar pelo canal JSON dos callbacks do Dash
+UPLOAD_JS = """
+(function () {
+    const CHUNK_SIZE = 4 * 1024 * 1024;
+    const MAX_RETRIES = 5;
+    const JOB_POLL_TIMEOUT_MS = 15 * 1000;
+    const JOB_STALL_MS = 120 * 1000;  // sem batimento do job nesse intervalo: desiste
+
+    function prefix() {
+        const cfg = document.getElementById('_dash-config');
+        return cfg ? JSON.parse(cfg.textContent).requests_pathname_prefix : '/';
+    }
 
-def clean_excel(xls: pd.ExcelFile) -> pd.DataFrame:
-    """Limpeza otimizada de Excel"""
-    sheet = "rptProcAdm" if "rptProcAdm" in xls.sheet_names else xls.sheet_names[0]
-    df = xls.parse(sheet, skiprows=7)
-    
-    if df.empty:
-        return pd.DataFrame(columns=["Tipo","Setor","Situacao"])
-    
-    df.columns = df.iloc[0]
-    df = df.iloc[1:].copy()
-    df.columns.name = None
-
-    cols = list(df.columns)
-    if len(cols) >= 10:
-        cols[:10] = EXPECTED_COLS
-        df.columns = cols
-
-    # Mapear colunas
-    mappings = {"Tipo": "TIPO", "Setor": "SETOR", "Situacao": "SITUA"}
-    for target, search in mappings.items():
-        if target not in df.columns:
-            for col in df.columns:
-                if search in str(col).upper():
-                    df.rename(columns={col: target}, inplace=True)
-                    break
+    function newUploadId() {
+        const bytes = new Uint8Array(16);
+        crypto.getRandomValues(bytes);
+        return Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function received(url) {
+        const resp = await fetch(url);
+        return resp.ok ? (await resp.json()).received : 0;
+    }
+
+    function showProgress(text) {
+        window.dash_clientside.set_props('loading-text', {children: text});
+    }
+
+    async function sendChunks(file, url, label) {
+        let offset = 0;
+        let retries = 0;
+        while (offset < file.size) {
+            showProgress('Enviando arquivo ' + (label ? label + ' ' : '') + '... '
+                         + Math.floor(100 * offset / file.size) + '%');
+            try {
+                const chunk = file.slice(offset, offset + CHUNK_SIZE);
+                const resp = await fetch(url + '?offset=' + offset, {method: 'PUT', body: chunk});
+                const body = await resp.json().catch(() => ({}));
+                if (resp.status === 409) {
+                    offset = body.received;  // servidor em outro ponto: retoma de lá
+                    continue;
+                }
+                if (!resp.ok) {
+                    const err = new Error(body.error || resp.statusText);
+                    // 4xx (limite de tamanho, ID inválido): repetir não muda a resposta
+                    err.final = resp.status >= 400 && resp.status < 500;
+                    throw err;
+                }
+                offset = body.received;
+                retries = 0;
+            } catch (err) {
+                if (err.final || ++retries > MAX_RETRIES) throw err;
+                await new Promise(r => setTimeout(r, 500 * retries));
+                offset = await received(url);
+            }
+        }
+    }
+
+    async function waitJob(url) {
+        const phases = {fila: 'Na fila', leitura: 'Lendo planilha', 'indexação': 'Indexando'};
+        let updated = null;
+        let lastChange = Date.now();
+        while (true) {
+            let resp = null, job = null;
+            try {
+                resp = await fetch(url, {signal: AbortSignal.timeout(JOB_POLL_TIMEOUT_MS)});
+                job = await resp.json();
+            } catch (err) {
+                job = null;  // falha de rede: tenta de novo até JOB_STALL_MS
+            }
+            if (job) {
+                if (!resp.ok || job.state === 'error') throw new Error(job.error || resp.statusText);
+                if (job.state === 'done') return job;
+                if (job.updated !== updated) {
+                    updated = job.updated;
+                    lastChange = Date.now();
+                }
+                showProgress((phases[job.phase] || 'Processando') + '... '
+                             + job.rows.toLocaleString('pt-BR') + ' linhas');
+            }
+            if (Date.now() - lastChange > JOB_STALL_MS) {
+                throw new Error('Tempo esgotado aguardando o processamento do arquivo');
+            }
+            await new Promise(r => setTimeout(r, 500));
+        }
+    }
+
+    function allSheets() {
+        const el = document.getElementById('upload-all-sheets');
+        const box = el && (el.matches('input') ? el : el.querySelector('input'));
+        return Boolean(box && box.checked);
+    }
+
+    async function upload(files) {
+        const dc = window.dash_clientside;
+        files = Array.from(files);
+        const filename = files.length === 1 ? files[0].name : files.length + ' arquivos';
+        if (!files.every(f => f.name.toLowerCase().endsWith('.xlsx'))) {
+            dc.set_props('store-upload', {data: {error: 'Apenas arquivos .xlsx', filename: filename}});
+            return;
+        }
+        dc.set_props('store-loading', {data: true});
+        const ids = files.map(newUploadId);
+        const url = id => prefix() + 'upload/' + id;
+        try {
+            for (let i = 0; i < files.length; i++) {
+                await sendChunks(files[i], url(ids[i]), files.length > 1 ? (i + 1) + '/' + files.length : '');
+            }
+            // Todos os arquivos viram um único job (e um único dataset)
+            const resp = await fetch(url(ids[0]) + '/complete', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({uploads: ids.slice(1), all_sheets: allSheets()}),
+            });
+            const body = await resp.json();
+            if (!resp.ok) throw new Error(body.error || resp.statusText);
+            const job = await waitJob(url(ids[0]) + '/job');
+            dc.set_props('store-upload', {data: {dataset_id: job.dataset_id, rows: job.rows,
+                                                 filename: filename}});
+        } catch (err) {
+            dc.set_props('store-upload', {data: {error: String(err.message || err), filename: filename}});
+        }
+    }
 
-    keep = [c for c in ["Tipo","Setor","Situacao"] if c in df.columns]
-    df = df[keep].copy() if keep else pd.DataFrame(columns=["Tipo","Setor","Situacao"])
+    document.addEventListener('click', function (ev) {
+        if (!ev.target.closest('#upload-area')) return;
+        const input = document.createElement('input');
+        input.type = 'file';
+        input.accept = '.xlsx';
+        input.multiple = true;
+        input.onchange = () => input.files.length && upload(input.files);
+        input.click();
+    });
+    document.addEventListener('dragover', function (ev) {
+        const area = ev.target.closest('#upload-area');
+        if (!area) return;
+        ev.preventDefault();
+        area.classList.add('dragover');
+    });
+    document.addEventListener('dragleave', function (ev) {
+        const area = ev.target.closest('#upload-area');
+        if (area) area.classList.remove('dragover');
+    });
+    document.addEventListener('drop', function (ev) {
+        const area = ev.target.closest('#upload-area');
+        if (!area) return;
+        ev.preventDefault();
+        area.classList.remove('dragover');
+        if (ev.dataTransfer.files.length) upload(ev.dataTransfer.files);
+    });
+})();
+"""
 
-    if not df.empty:
-        for c in keep:
-            df[c] = df[c].astype(str).str.strip()
-        mask = ~df[keep].isin(["", "nan", "none", "None"]).any(axis=1)
-        df = df[mask]
+# Modo clientside: filtros sobre o cubo compacto (store-cube) direto no navegador
+CUBE_JS = """
+(function () {
+    const ns = window.dash_clientside = window.dash_clientside || {};
+    const DIMS = ['Setor', 'Tipo', 'Situacao'];
+    const TABLE = 'table-processos';
+    let prepared = null;
 
-    return df
+    function el(type, props, namespace) {
+        return {type: type, namespace: namespace || 'dash_html_components', props: props || {}};
+    }
+
+    function abbreviate(s, maxlen) {
+        s = String(s);
+        return s.length > maxlen ? s.slice(0, maxlen - 1) + '…' : s;
+    }
+
+    // Valor em minúsculas -> códigos, como no CountCube do servidor
+    function lookup(cube) {
+        if (prepared && prepared.cube === cube) return prepared.lookup;
+        const byDim = {};
+        DIMS.forEach(dim => {
+            const map = new Map();
+            cube.labels[dim].forEach((label, code) => {
+                const key = String(label).toLowerCase();
+                if (!map.has(key)) map.set(key, []);
+                map.get(key).push(code);
+            });
+            byDim[dim] = map;
+        });
+        prepared = {cube: cube, lookup: byDim};
+        return byDim;
+    }
+
+    // Células selecionadas: OR dentro de cada dimensão, AND entre elas
+    function select(cube, setor, tipos, situacoes) {
+        const byDim = lookup(cube);
+        const filters = [];
+        [['Setor', setor ? [setor] : []], ['Tipo', tipos || []], ['Situacao', situacoes || []]]
+            .forEach(([dim, values]) => {
+                if (!values.length) return;
+                const allowed = new Uint8Array(cube.labels[dim].length);
+                values.forEach(v => (byDim[dim].get(String(v).toLowerCase()) || [])
+                    .forEach(code => { allowed[code] = 1; }));
+                filters.push([cube.cells[dim], allowed]);
+            });
+        const selected = [];
+        for (let i = 0; i < cube.counts.length; i++) {
+            if (filters.every(([cells, allowed]) => allowed[cells[i]])) selected.push(i);
+        }
+        return selected;
+    }
+
+    function totals(cube, dim, selected) {
+        const tot = new Array(cube.labels[dim].length).fill(0);
+        selected.forEach(i => { tot[cube.cells[dim][i]] += cube.counts[i]; });
+        return tot;
+    }
+
+    function active(cube, dsId) {
+        return Boolean(cube) && cube.id === dsId;
+    }
+
+    function prefix() {
+        const cfg = document.getElementById('_dash-config');
+        return cfg ? JSON.parse(cfg.textContent).requests_pathname_prefix : '/';
+    }
+
+    ns.analytics = {
+        // Link da rota de exportação com os filtros atuais
+        exportHref: function (selection, format, raw) {
+            if (!selection) return '';
+            const params = new URLSearchParams();
+            if (selection.setor) params.append('setor', selection.setor);
+            selection.tipos.forEach(t => params.append('tipo', t));
+            selection.situacoes.forEach(s => params.append('situacao', s));
+            if (raw) params.append('linhas', '1');
+            return prefix() + 'export/' + selection.ds_id + '.' + (format || 'xlsx') + '?' + params.toString();
+        },
 
-def parse_uploaded(contents: str) -> pd.DataFrame:
-    """Parse otimizado de upload"""
+        // Ponto único dos filtros: cada ação vira uma seleção só, e os callbacks
+        // do servidor (KPIs e tabela) só recebem filtros quando não há cubo
+        route: function (setor, tipos, situacoes, dsId, page, sortBy, query, cube) {
+            const nu = window.dash_clientside.no_update;
+            const triggered = window.dash_clientside.callback_context.triggered.map(t => t.prop_id);
+            const paging = triggered.length > 0 && triggered.every(p => p === TABLE + '.page_current');
+            const tableOnly = triggered.length > 0 && triggered.every(p => p.startsWith(TABLE + '.'));
+            // Trocar setor ou dataset zera tipos e situações aqui mesmo, sem outra rodada
+            const reset = triggered.some(p => p === 'dd-setor.value' || p === 'store-data.data');
+            const resets = reset ? [[], []] : [nu, nu];
+            if (reset) {
+                tipos = [];
+                situacoes = [];
+            }
+            const selection = !dsId || tableOnly ? nu
+                : {ds_id: dsId, setor: setor || null, tipos: tipos || [], situacoes: situacoes || []};
+            if (!dsId || active(cube, dsId)) return [selection, nu, nu, paging ? nu : 0, ...resets];
+            return [
+                selection,
+                selection,
+                {page: paging ? page || 0 : 0, sort_by: sortBy || [], filter_query: query || ''},
+                paging ? nu : 0,
+                ...resets,
+            ];
+        },
+
+        // KPIs e alerta de total
+        summary: function (selection, cube) {
+            if (!selection || !active(cube, selection.ds_id)) return Array(6).fill(window.dash_clientside.no_update);
+            const setor = selection.setor;
+            const tipos = selection.tipos;
+            const situacoes = selection.situacoes;
+            const selected = select(cube, setor, tipos, situacoes);
+            const total = selected.reduce((acc, i) => acc + cube.counts[i], 0);
+            const present = dim => totals(cube, dim, selected).filter(v => v > 0).length;
+            const sits = totals(cube, 'Situacao', selected);
+            let top = -1;
+            sits.forEach((v, code) => { if (v > 0 && (top < 0 || v > sits[top])) top = code; });
+
+            const alert = total > 0
+                ? el('Alert', {color: 'primary', className: 'mb-0', children: [
+                    el('I', {className: 'fas fa-chart-line me-2'}),
+                    el('Strong', {children: '📈 ' + total.toLocaleString('en-US') + ' processos encontrados'}),
+                    el('Br'),
+                    el('Small', {children: 'Filtros: Setor=' + (setor || 'Todos') + ' | Tipos=' + tipos.length +
+                                           ' | Situações=' + situacoes.length}),
+                  ]}, 'dash_bootstrap_components')
+                : el('Alert', {color: 'warning', className: 'mb-0', children: [
+                    el('I', {className: 'fas fa-search me-2'}),
+                    '🔍 Nenhum processo encontrado',
+                  ]}, 'dash_bootstrap_components');
+
+            return [
+                total.toLocaleString('en-US'),
+                String(present('Setor')),
+                String(present('Tipo')),
+                String(top < 0 ? 0 : sits[top]),
+                'Top: ' + (top < 0 ? 'N/A' : abbreviate(cube.labels.Situacao[top], 15)),
+                alert,
+            ];
+        },
+
+        // Tabela inteira com paginação, ordenação e filtro nativos da DataTable
+        table: function (selection, cube) {
+            const nu = window.dash_clientside.no_update;
+            if (!selection || !active(cube, selection.ds_id)) return [nu, 'custom', 'custom', 'custom'];
+            const rows = select(cube, selection.setor, selection.tipos, selection.situacoes).map(i => ({
+                Setor: cube.labels.Setor[cube.cells.Setor[i]],
+                Tipo: cube.labels.Tipo[cube.cells.Tipo[i]],
+                Situacao: cube.labels.Situacao[cube.cells.Situacao[i]],
+                Quantidade: cube.counts[i],
+            }));
+            return [rows, 'native', 'native', 'native'];
+        },
+    };
+})();
+"""
+
+# -------------- Métricas --------------
+class Metrics:
+    """Contadores, gauges e histogramas do processo, no formato texto do Prometheus
+
+    Os valores são do processo; snapshot() e merge() juntam os de vários workers
+    (contadores e histogramas somados, gauges separados pelo rótulo pid).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families = {}    # nome -> (tipo, ajuda, buckets)
+        self._values = {}      # nome -> {labels: valor ou [contagens por bucket, soma]}
+
+    def register(self, kind: str, name: str, help_text: str, buckets=None) -> None:
+        self._families[name] = (kind, help_text, buckets)
+        self._values.setdefault(name, {})
+
+    def clear(self) -> None:
+        """Zera os valores (processo filho de um fork não herda os do pai)"""
+        self._lock = threading.Lock()
+        self._values = {name: {} for name in self._families}
+
+    def snapshot(self, values=None) -> dict:
+        """Valores em formato JSON: nome -> [[pares de rótulos, valor], ...]"""
+        with self._lock:
+            values = self._values if values is None else values
+            # Cópia das contagens dos histogramas: o retrato é serializado fora do lock
+            return {name: [[list(map(list, labels)), [list(value[0]), value[1]] if isinstance(value, list) else value]
+                           for labels, value in series.items()]
+                    for name, series in values.items()}
+
+    def merge(self, snapshots: dict, gauges: bool = True) -> dict:
+        """Soma os retratos {pid: snapshot}; gauges de cada processo ganham o rótulo pid"""
+        merged = {name: {} for name in self._families}
+        for pid, snapshot in snapshots.items():
+            for name, series in snapshot.items():
+                if name not in self._families:
+                    continue
+                kind, _, buckets = self._families[name]
+                for labels, value in series:
+                    key = tuple(map(tuple, labels))
+                    if kind == "gauge":
+                        if gauges:
+                            merged[name][tuple(sorted(key + (("pid", str(pid)),)))] = value
+                    elif kind == "histogram":
+                        item = merged[name].setdefault(key, [[0] * (len(buckets) + 1), 0.0])
+                        item[0] = [a + b for a, b in zip(item[0], value[0])]
+                        item[1] += value[1]
+                    else:
+                        merged[name][key] = merged[name].get(key, 0) + value
+        return merged
+
+    def inc(self, name: str, value=1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value, **labels) -> None:
+        with self._lock:
+            self._values[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        buckets = self._families[name][2]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values[name]
+            item = series.get(key)
+            if item is None:
+                item = series[key] = [[0] * (len(buckets) + 1), 0.0]
+            item[0][bisect.bisect_left(buckets, value)] += 1
+            item[1] += value
+
+    def render(self, values=None) -> str:
+        def fmt(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                       for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            values = self._values if values is None else values
+            for name, (kind, help_text, buckets) in self._families.items():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for labels, value in sorted(values[name].items()):
+                    if kind != "histogram":
+                        lines.append(f"{name}{fmt(labels)} {value}")
+                        continue
+                    counts, total = value
+                    cumulative = list(itertools.accumulate(counts))
+                    for le, n in zip([*buckets, "+Inf"], cumulative):
+                        lines.append(f"{name}_bucket{fmt(labels, [('le', le)])} {n}")
+                    lines.append(f"{name}_sum{fmt(labels)} {total}")
+                    lines.append(f"{name}_count{fmt(labels)} {cumulative[-1]}")
+        return "\n".join(lines) + "\n"
+
+METRICS = Metrics()
+METRICS.register("counter", "analytics_requests_total", "Requisições por callback (ou rota) e status HTTP")
+METRICS.register("histogram", "analytics_request_seconds", "Latência total por callback", LATENCY_BUCKETS)
+METRICS.register("histogram", "analytics_request_phase_seconds",
+                 "Tempo por fase (deserialize, filter, aggregate, render, serialize, other)", LATENCY_BUCKETS)
+METRICS.register("histogram", "analytics_request_payload_bytes", "Tamanho do corpo recebido e enviado",
+                 SIZE_BUCKETS)
+METRICS.register("counter", "analytics_cache_requests_total", "Consultas aos caches por resultado (hit/miss)")
+METRICS.register("gauge", "analytics_cache_entries", "Itens nos caches em memória")
+METRICS.register("histogram", "analytics_ingest_seconds", "Duração dos jobs de ingestão", LATENCY_BUCKETS)
+METRICS.register("counter", "analytics_ingest_rows_total", "Linhas limpas pelos jobs de ingestão")
+METRICS.register("gauge", "analytics_datasets_bytes", "Memória privada dos datasets registrados")
+if hasattr(os, "register_at_fork"):
+    # gunicorn --preload: cada worker começa do zero e grava só o que ele mesmo mediu
+    os.register_at_fork(after_in_child=METRICS.clear)
+
+class RequestTiming:
+    """Fases de uma requisição instrumentada (tempo próprio, sem as fases aninhadas)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.stack = []
+
+_REQUEST = threading.local()
+
+@contextmanager
+def phase(name: str):
+    """Conta o bloco na fase `name` da requisição atual (nada fora de uma requisição)"""
+    timing = getattr(_REQUEST, "timing", None)
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    timing.stack.append(0.0)
     try:
-        ctype, content_string = contents.split(",")
-        raw = base64.b64decode(content_string)
-        xls = pd.ExcelFile(io.BytesIO(raw))
-        return clean_excel(xls)
-    except Exception as e:
-        print(f"Erro no upload: {e}")
-        return pd.DataFrame(columns=["Tipo","Setor","Situacao"])
+        yield
+    finally:
+        nested = timing.stack.pop()
+        elapsed = time.perf_counter() - start
+        timing.phases[name] = timing.phases.get(name, 0.0) + elapsed - nested
+        if timing.stack:
+            timing.stack[-1] += elapsed
 
-def load_local_or_sample() -> pd.DataFrame:
-    """Carregamento otimizado"""
+# -------------- Funções Otimizadas --------------
+def load_local_or_sample() -> str:
+    """Carregamento otimizado; devolve o ID do dataset registrado"""
     try:
         if os.path.exists(LOCAL_XLSX):
-            return clean_excel_cached(LOCAL_XLSX)
-    except:
-        pass
+            return ingest_excel(LOCAL_XLSX)
+    except Exception as e:
+        print(f"Erro ao carregar {LOCAL_XLSX}: {e}")
 
-    return pd.DataFrame([
+    return register_dataset(pd.DataFrame([
         {"Setor":"ARQUIVO SRH","Tipo":"CTC","Situacao":"CONCLUSO"},
         {"Setor":"ARQUIVO SRH","Tipo":"CTC","Situacao":"EM ANÁLISE"},
         {"Setor":"ARQUIVO SRH","Tipo":"FICHA FINANCEIRA","Situacao":"EM ANÁLISE"},
@@ -392,7 +894,581 @@ def load_local_or_sample() -> pd.DataFrame:
         {"Setor":"FINANCEIRO","Tipo":"REEMBOLSO","Situacao":"AGUARDANDO ANÁLISE"},
         {"Setor":"FINANCEIRO","Tipo":"AUXÍLIO","Situacao":"INDEFERIDO"},
         {"Setor":"PROTOCOLO","Tipo":"CERTIDÃO","Situacao":"CONCLUSO"},
-    ])
+    ]))
+
+# -------------- Cubo de Contagens --------------
+class CountCube:
+    """Contagem de processos por célula (Setor, Tipo, Situação) com códigos inteiros"""
+
+    def __init__(self, labels: dict, cells: dict, counts: np.ndarray):
+        self.labels = labels
+        self.cells = cells
+        self.counts = counts
+        self.lookup = {dim: self._lower_lookup(labels[dim]) for dim in DIMENSIONS}
+
+        # Índice invertido: valor normalizado -> bitmap compactado das células
+        self.bitmaps = {dim: self._build_bitmaps(dim) for dim in DIMENSIONS}
+
+    @classmethod
+    def from_codes(cls, codes: dict, labels: dict) -> "CountCube":
+        """Agrega as linhas codificadas; só as combinações presentes viram células"""
+        key = np.zeros(len(codes[DIMENSIONS[0]]), dtype=np.int64)
+        for dim in DIMENSIONS:
+            key = key * max(len(labels[dim]), 1) + codes[dim]
+
+        keys, counts = np.unique(key, return_counts=True)
+        cells = {}
+        for dim in reversed(DIMENSIONS):
+            n = max(len(labels[dim]), 1)
+            cells[dim] = (keys % n).astype(code_dtype(n))
+            keys = keys // n
+        return cls(labels, cells, counts.astype(np.int64))
+
+    @staticmethod
+    def _lower_lookup(labels) -> dict:
+        """Valor em minúsculas -> códigos (variações de caixa caem no mesmo filtro)"""
+        lookup = {}
+        for code, label in enumerate(labels):
+            lookup.setdefault(str(label).lower(), []).append(code)
+        return {k: np.array(v, dtype=np.int32) for k, v in lookup.items()}
+
+    def _build_bitmaps(self, dim: str) -> dict:
+        """Bitmap compactado por valor, ligando só os bits das células de cada código
+
+        As células são agrupadas por código com uma ordenação, sem a matriz densa
+        valores × células: a memória extra é a dos próprios bitmaps.
+        """
+        n = len(self.counts)
+        codes = self.cells[dim]
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(self.labels[dim]) + 1))
+        bitmaps = {}
+        for value, value_codes in self.lookup[dim].items():
+            positions = np.concatenate([order[bounds[c]:bounds[c + 1]] for c in value_codes])
+            bits = np.zeros((n + 7) // 8, dtype=np.uint8)
+            # Mesma ordem de bits do np.packbits: a célula i é o bit 7 - i % 8 do byte i // 8
+            np.bitwise_or.at(bits, positions >> 3, (0x80 >> (positions & 7)).astype(np.uint8))
+            bitmaps[value] = bits
+        return bitmaps
+
+    @property
+    def nbytes(self) -> int:
+        return private_nbytes(self.counts, *self.cells.values(), *self.labels.values(),
+                              *(b for bm in self.bitmaps.values() for b in bm.values()))
+
+    def mask(self, setor=None, tipos=(), situacoes=()) -> np.ndarray:
+        """Máscara sobre as células: OR dos bitmaps em cada dimensão, AND entre elas"""
+        n = len(self.counts)
+        selected = None
+        for dim, values in (("Setor", [setor] if setor else []),
+                            ("Tipo", tipos), ("Situacao", situacoes)):
+            if not values:
+                continue
+            bits = np.zeros((n + 7) // 8, dtype=np.uint8)
+            for v in values:
+                bitmap = self.bitmaps[dim].get(str(v).lower())
+                if bitmap is not None:
+                    bits |= bitmap
+            selected = bits if selected is None else selected & bits
+        if selected is None:
+            return np.ones(n, dtype=bool)
+        return np.unpackbits(selected, count=n).astype(bool)
+
+    def totals(self, dim: str, mask: np.ndarray) -> pd.Series:
+        """Totais por valor de uma dimensão (apenas valores presentes)"""
+        tot = np.bincount(self.cells[dim][mask], weights=self.counts[mask],
+                          minlength=len(self.labels[dim])).astype(np.int64)
+        nz = tot > 0
+        return pd.Series(tot[nz], index=pd.Index(self.labels[dim][nz], name=dim), name="Quantidade")
+
+    def table(self, mask: np.ndarray) -> pd.DataFrame:
+        """Tabela (Setor, Tipo, Situação, Quantidade) das células selecionadas"""
+        data = {dim: self.labels[dim][self.cells[dim][mask]] for dim in DIMENSIONS}
+        data["Quantidade"] = self.counts[mask]
+        return pd.DataFrame(data)
+
+class Dataset:
+    """Dataset registrado: códigos por dimensão, rótulos ordenados e o cubo de contagens"""
+
+    def __init__(self, ds_id: str, codes: dict, labels: dict, cube: CountCube = None):
+        self.id = ds_id
+        self.codes = codes
+        self.labels = labels
+        self.nrows = len(codes[DIMENSIONS[0]])
+        self.cube = cube if cube is not None else CountCube.from_codes(codes, labels)
+        self.touched = time.monotonic()
+        # Só a memória própria do worker conta no orçamento do registro
+        self.nbytes = private_nbytes(*codes.values()) + self.cube.nbytes
+
+def private_nbytes(*arrays) -> int:
+    """Bytes fora de arquivos mapeados (np.memmap é compartilhado entre workers)"""
+    return int(sum(a.nbytes for a in arrays if not isinstance(a, np.memmap)))
+
+# -------------- Registro de Datasets --------------
+class DatasetRegistry:
+    """Datasets compartilhados em memória, com despejo LRU por orçamento de bytes"""
+
+    def __init__(self, max_bytes: int, max_items: int):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+
+    def put(self, ds_id: str, dataset: Dataset) -> str:
+        size = dataset.nbytes
+        with self._lock:
+            if ds_id in self._items:
+                self._items.move_to_end(ds_id)
+                return ds_id
+            self._items[ds_id] = (dataset, size)
+            self.nbytes += size
+            # O item recém-inserido nunca é despejado, mesmo acima do orçamento
+            while len(self._items) > 1 and (
+                self.nbytes > self.max_bytes or len(self._items) > self.max_items
+            ):
+                _, (_, old_size) = self._items.popitem(last=False)
+                self.nbytes -= old_size
+        return ds_id
+
+    def get(self, ds_id: str):
+        with self._lock:
+            item = self._items.get(ds_id)
+            if item is None:
+                return None
+            self._items.move_to_end(ds_id)
+            return item[0]
+
+    def __contains__(self, ds_id: str) -> bool:
+        return ds_id in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def ids(self) -> set:
+        with self._lock:
+            return set(self._items)
+
+DATASETS = DatasetRegistry(DATASET_CACHE_MAX_BYTES, DATASET_CACHE_MAX_ITEMS)
+BASE_DATASET = None  # fixado na inicialização do app
+
+def code_dtype(n: int):
+    """Menor inteiro capaz de representar n códigos"""
+    return np.uint8 if n <= 1 << 8 else np.uint16 if n <= 1 << 16 else np.int32
+
+def encode_column(col: pd.Series) -> tuple:
+    """Normaliza (strip) e codifica uma coluna sobre os rótulos ordenados"""
+    if isinstance(col.dtype, pd.CategoricalDtype) and not (col.cat.codes < 0).any():
+        # Categórica (vinda da ingestão): só as categorias são normalizadas,
+        # as linhas já chegam como inteiros e nunca viram strings
+        col = col.cat.remove_unused_categories()
+        remap, labels = pd.factorize(col.cat.categories.astype(str).str.strip(), sort=True)
+        codes = remap[col.cat.codes.to_numpy()]
+    else:
+        codes, labels = pd.factorize(col.astype(str).str.strip(), sort=True)
+    return codes.astype(code_dtype(len(labels))), np.asarray(labels, dtype=object)
+
+def encode_dataset(df: pd.DataFrame) -> tuple:
+    """Representação canônica: um código inteiro compacto por dimensão e os rótulos"""
+    codes, labels = {}, {}
+    for dim in DIMENSIONS:
+        col = df[dim] if dim in df.columns else pd.Series("N/A", index=df.index)
+        codes[dim], labels[dim] = encode_column(col)
+    return codes, labels
+
+def dataset_id(codes: dict, labels: dict) -> str:
+    """Hash do conteúdo do dataset, usado como chave no registro"""
+    h = hashlib.sha1()
+    for dim in DIMENSIONS:
+        h.update("\x1f".join(labels[dim]).encode())
+        h.update(codes[dim].tobytes())
+    return h.hexdigest()[:20]
+
+def register_dataset(df: pd.DataFrame) -> str:
+    """Normaliza, monta o cubo, registra e devolve o ID do dataset"""
+    codes, labels = encode_dataset(df)
+    ds_id = dataset_id(codes, labels)
+    # Conteúdo já registrado: reaproveita o cubo existente
+    dataset = DATASETS.get(ds_id)
+    if dataset is None:
+        dataset = Dataset(ds_id, codes, labels)
+        save_dataset(dataset)
+        # Troca a cópia privada pela versão mapeada, a mesma que os outros workers usam
+        dataset = load_dataset(ds_id) or dataset
+        DATASETS.put(ds_id, dataset)
+        # Novo dataset em disco: aplica o orçamento (o recém-registrado fica)
+        _evict_datasets()
+        return ds_id
+    return DATASETS.put(ds_id, dataset)
+
+def get_dataset(ds_id):
+    """Resolve o ID guardado em store-data para o dataset compartilhado"""
+    if not ds_id or not isinstance(ds_id, str):
+        return None
+    dataset = DATASETS.get(ds_id)
+    METRICS.inc("analytics_cache_requests_total", cache="datasets", result="miss" if dataset is None else "hit")
+    if dataset is None:
+        # Despejado, de outro worker ou de antes de um restart: recarrega do disco
+        base = BASE_DATASET
+        dataset = base if base is not None and base.id == ds_id else load_dataset(ds_id)
+        if dataset is not None:
+            DATASETS.put(ds_id, dataset)
+    elif time.monotonic() - dataset.touched >= DATASET_TOUCH_SECONDS:
+        # Em uso: adia a remoção por idade em disco (vale para todos os workers)
+        _touch_dataset(dataset)
+    return dataset
+
+# -------------- Cache em Disco --------------
+def _cache_path(*parts) -> str:
+    return os.path.join(CACHE_DIR, *parts)
+
+def _atomic_write(path: str, write) -> None:
+    """Grava em arquivo temporário e renomeia (seguro entre workers)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def _dataset_dir(ds_id: str) -> str:
+    return os.path.join(DATASET_DIR, ds_id)
+
+def save_dataset(dataset: Dataset) -> None:
+    """Persiste códigos e células do cubo como .npy e os rótulos em JSON
+
+    O diretório é montado à parte e renomeado de uma vez, então nenhum worker
+    enxerga um dataset pela metade.
+    """
+    folder = _dataset_dir(dataset.id)
+    if os.path.exists(os.path.join(folder, "meta.json")):
+        return
+    tmp = f"{folder}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(tmp, exist_ok=True)
+        for dim in DIMENSIONS:
+            np.save(os.path.join(tmp, f"{dim}_codes.npy"), dataset.codes[dim])
+            np.save(os.path.join(tmp, f"{dim}_cells.npy"), dataset.cube.cells[dim])
+        np.save(os.path.join(tmp, "counts.npy"), dataset.cube.counts)
+        meta = {"nrows": dataset.nrows,
+                "labels": {dim: dataset.labels[dim].tolist() for dim in DIMENSIONS}}
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        os.rename(tmp, folder)
+    except OSError as e:
+        # Outro worker pode ter gravado o mesmo dataset primeiro
+        if not os.path.exists(os.path.join(folder, "meta.json")):
+            print(f"Erro ao gravar cache: {e}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def load_dataset(ds_id: str):
+    """Anexa um dataset persistido sem copiar: os arrays são mapeados (mmap) do disco"""
+    folder = _dataset_dir(ds_id)
+    if not DATASET_ID_RE.match(ds_id) or not os.path.exists(os.path.join(folder, "meta.json")):
+        return None
+    try:
+        with open(os.path.join(folder, "meta.json")) as f:
+            meta = json.load(f)
+        labels = {dim: np.array(meta["labels"][dim], dtype=object) for dim in DIMENSIONS}
+        load = lambda name: np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="r")
+        codes = {dim: load(f"{dim}_codes") for dim in DIMENSIONS}
+        cube = CountCube(labels, {dim: load(f"{dim}_cells") for dim in DIMENSIONS}, load("counts"))
+    except Exception as e:
+        print(f"Erro ao ler cache {folder}: {e}")
+        return None
+    dataset = Dataset(ds_id, codes, labels, cube)
+    _touch_dataset(dataset)
+    return dataset
+
+def _touch_dataset(dataset: Dataset) -> None:
+    """Marca o uso do dataset no mtime do diretório (base da remoção por idade)"""
+    dataset.touched = time.monotonic()
+    try:
+        os.utime(_dataset_dir(dataset.id))
+    except OSError:
+        pass
+
+def _evict_datasets() -> None:
+    """Remove datasets sem uso há DATASET_DISK_TTL e, acima de DATASET_DISK_MAX_BYTES, os mais antigos
+
+    O dataset base e os registrados neste worker ficam. O diretório é renomeado
+    antes de apagado, então nenhum worker anexa um dataset pela metade; quem já
+    o mapeou continua lendo até soltar os arrays.
+    """
+    if not os.path.isdir(DATASET_DIR):
+        return
+    keep = DATASETS.ids() | ({BASE_DATASET.id} if BASE_DATASET is not None else set())
+    now = time.time()
+    entries = []
+    for entry in os.scandir(DATASET_DIR):
+        try:
+            mtime = entry.stat().st_mtime
+            if entry.name.endswith(".tmp"):
+                # Sobra de um worker morto no meio de save_dataset ou da remoção
+                if now - mtime >= UPLOAD_STALE_SECONDS:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry.path))
+        except OSError:
+            continue
+        if entry.name in keep:
+            entries.append((now, size, None))
+        elif now - mtime >= DATASET_DISK_TTL:
+            _remove_dataset_dir(entry.path)
+        else:
+            entries.append((mtime, size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries, key=lambda e: e[0]):
+        if total <= DATASET_DISK_MAX_BYTES:
+            break
+        if path is not None:
+            _remove_dataset_dir(path)
+            total -= size
+
+def _remove_dataset_dir(path: str) -> None:
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.evict.tmp"
+    try:
+        os.rename(path, tmp)
+    except OSError:
+        return  # já removido por outro worker
+    shutil.rmtree(tmp, ignore_errors=True)
+
+def file_digest(source) -> str:
+    """SHA-256 do conteúdo de um arquivo (caminho) ou de bytes"""
+    h = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray)):
+        h.update(source)
+    else:
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+def clean_parallel(sources, progress=None, all_sheets=False) -> pd.DataFrame:
+    """Lê várias planilhas em processos e concatena as partes na ordem recebida
+
+    O pool é criado por job e encerrado ao fim da leitura, então nenhum processo
+    fica parado no worker entre uploads. spawn: o worker tem threads (jobs,
+    servidor) e fork copiaria locks presos; os filhos importam só o cleaning e
+    devolvem códigos e rótulos, e o DataFrame é montado aqui.
+    """
+    pool = ProcessPoolExecutor(max_workers=min(INGEST_PROCESSES, len(sources)),
+                               mp_context=multiprocessing.get_context("spawn"))
+    try:
+        futures = {pool.submit(read_sheets, source, None, all_sheets): i for i, source in enumerate(sources)}
+        pieces, done = [None] * len(sources), 0
+        for future in as_completed(futures):
+            pieces[futures[future]] = future.result()
+            done += sum(piece_rows(p) for p in pieces[futures[future]])
+            if progress:
+                progress("leitura", done)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return concat_pieces(itertools.chain.from_iterable(pieces))
+
+def ingest_excel(sources, progress=None, all_sheets=False) -> str:
+    """Limpa e registra uma ou mais planilhas (caminhos ou bytes), reaproveitando o cache em disco"""
+    if not isinstance(sources, (list, tuple)):
+        sources = [sources]
+    digests = [file_digest(source) for source in sources]
+    if len(sources) == 1 and not all_sheets:
+        key = digests[0]
+    else:
+        # Conjunto de arquivos: mesma chave em qualquer ordem de envio
+        order = sorted(range(len(sources)), key=digests.__getitem__)
+        sources = [sources[i] for i in order]
+        key = hashlib.sha256("\n".join([digests[i] for i in order] + ["all_sheets"] * all_sheets)
+                             .encode()).hexdigest()
+    pointer = _cache_path("files", f"{key}-c{CLEANER_VERSION}")
+    if os.path.exists(pointer):
+        with open(pointer) as f:
+            ds_id = f.read().strip()
+        # Planilha conhecida: nenhuma leitura de Excel
+        if get_dataset(ds_id) is not None:
+            METRICS.inc("analytics_cache_requests_total", cache="ingest", result="hit")
+            return ds_id
+    METRICS.inc("analytics_cache_requests_total", cache="ingest", result="miss")
+
+    sizes = [len(source) if isinstance(source, (bytes, bytearray)) else os.path.getsize(source)
+             for source in sources]
+    if INGEST_PROCESSES > 1 and len(sources) > 1 and sum(sizes) - max(sizes) >= INGEST_PARALLEL_MIN_BYTES:
+        df = clean_parallel(sources, progress, all_sheets)
+    else:
+        pieces, done = [], 0
+        for source in sources:
+            file_progress = progress and (lambda phase, n, base=done: progress(phase, base + n))
+            sheets = read_sheets(source, file_progress, all_sheets)
+            pieces.extend(sheets)
+            done += sum(piece_rows(p) for p in sheets)
+        df = concat_pieces(pieces)
+    if progress:
+        progress("indexação", len(df))
+    ds_id = register_dataset(df)
+    try:
+        _atomic_write(pointer, lambda f: f.write(ds_id.encode()))
+    except OSError as e:
+        print(f"Erro ao gravar cache: {e}")
+    return ds_id
+
+# -------------- Motor de Filtros --------------
+# Execuções do pipeline por etapa (views calculadas e callbacks de view),
+# para conferir que uma interação calcula cada view uma única vez
+PIPELINE_RUNS = Counter()
+
+@lru_cache(maxsize=64)
+def _compute_view(ds_id: str, setor, tipos: tuple, situacoes: tuple):
+    PIPELINE_RUNS["compute_view"] += 1
+    dataset = get_dataset(ds_id)
+    if dataset is None:
+        # Exceção e não None: o lru_cache não guarda a falta, e o ID volta a
+        # funcionar quando o dataset for registrado de novo
+        raise LookupError(ds_id)
+
+    # Tudo sai do cubo: custo proporcional ao número de células, não de linhas
+    cube = dataset.cube
+    with phase("filter"):
+        mask = cube.mask(setor, tipos, situacoes)
+    with phase("aggregate"):
+        return {
+            "gt": cube.table(mask),
+            "total": int(cube.counts[mask].sum()),
+            "por_setor": cube.totals("Setor", mask),
+            "por_tipo": cube.totals("Tipo", mask),
+            "por_situacao": cube.totals("Situacao", mask),
+        }
+
+def filter_key(setor=None, tipos=None, situacoes=None) -> tuple:
+    """Filtros normalizados (sem caixa e sem ordem), usados como chave dos caches"""
+    return (
+        str(setor).lower() if setor else None,
+        tuple(sorted({str(t).lower() for t in tipos or ()})),
+        tuple(sorted({str(s).lower() for s in situacoes or ()})),
+    )
+
+def compute_view(ds_id, setor=None, tipos=None, situacoes=None):
+    """Filtra e agrega o dataset uma única vez por combinação de filtros"""
+    if not ds_id:
+        return None
+    try:
+        return _compute_view(ds_id, *filter_key(setor, tipos, situacoes))
+    except LookupError:
+        return None
+
+def client_cube(dataset):
+    """Cubo compacto (rótulos, códigos das células e contagens) para o navegador"""
+    cube = dataset.cube
+    if len(cube.counts) > CLIENTSIDE_MAX_CELLS:
+        return None
+    return {
+        "id": dataset.id,
+        "labels": {dim: cube.labels[dim].tolist() for dim in DIMENSIONS},
+        "cells": {dim: cube.cells[dim].tolist() for dim in DIMENSIONS},
+        "counts": cube.counts.tolist(),
+    }
+
+@lru_cache(maxsize=256)
+def _dropdown_options(ds_id: str, setor):
+    dataset = get_dataset(ds_id)
+    if dataset is None:
+        raise LookupError(ds_id)  # fora do cache, como em _compute_view
+    
+    # Opções dependentes a partir do bitmap do setor no cubo
+    cube = dataset.cube
+    with phase("filter"):
+        mask = cube.mask(setor)
+    with phase("aggregate"):
+        return tuple(
+            [{"label": v, "value": v} for v in cube.totals(dim, mask).index.tolist()]
+            for dim in ("Tipo", "Situacao")
+        )
+
+def dropdown_options(ds_id, setor=None):
+    """Opções de Tipo e Situação de um setor, calculadas uma vez por (dataset, setor)"""
+    if not ds_id:
+        return None
+    try:
+        return _dropdown_options(ds_id, filter_key(setor)[0])
+    except LookupError:
+        return None
+
+# Consulta da tabela: filtros e ordenação da DataTable sobre o agregado em cache
+# Operadores simbólicos também recebem o prefixo i/s do seletor de caixa da coluna
+FILTER_PART_RE = re.compile(r"^\{(?P<col>[^}]+)\}\s*(?P<op>[is]?(?:[<>!]=|[<>=])|[a-z]+)\s*(?P<value>.*)$")
+FILTER_OPERATORS = {
+    "=": "eq", "!=": "ne", "<": "lt", "<=": "le", ">": "gt", ">=": "ge",
+    "eq": "eq", "ne": "ne", "lt": "lt", "le": "le", "gt": "gt", "ge": "ge",
+    "contains": "contains",
+}
+
+def parse_filter_query(query: str) -> list:
+    """Partes (coluna, operador, valor, sem caixa) de um filter_query da DataTable"""
+    parts = []
+    for part in (query or "").split(" && "):
+        m = FILTER_PART_RE.match(part.strip())
+        if not m:
+            continue
+        op, insensitive = m["op"], False
+        # Prefixos i/s: comparação sem ou com caixa (filter_options.case)
+        if op not in FILTER_OPERATORS and op[:1] in ("i", "s") and op[1:] in FILTER_OPERATORS:
+            op, insensitive = op[1:], op[0] == "i"
+        if op not in FILTER_OPERATORS:
+            continue
+        value = m["value"].strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"`":
+            value = value[1:-1].replace("\\" + value[0], value[0])
+        parts.append((m["col"], FILTER_OPERATORS[op], value, insensitive))
+    return parts
+
+def _filter_mask(col: pd.Series, op: str, value: str, insensitive: bool) -> np.ndarray:
+    if op == "contains":
+        return col.astype(str).str.contains(value, case=not insensitive, regex=False).to_numpy()
+    if pd.api.types.is_numeric_dtype(col):
+        try:
+            value = float(value)
+        except ValueError:
+            return np.zeros(len(col), dtype=bool)
+    elif insensitive:
+        col, value = col.str.lower(), value.lower()
+    return getattr(col, op)(value).to_numpy()
+
+@lru_cache(maxsize=64)
+def _table_rows(ds_id: str, key: tuple, sort_by: tuple, query: str):
+    # Dataset ausente: o LookupError do _compute_view sobe sem entrar no cache
+    view = _compute_view(ds_id, *key)
+
+    # Filtro e ordenação da DataTable contam como a fase de filtro
+    with phase("filter"):
+        gt = view["gt"]
+        mask = np.ones(len(gt), dtype=bool)
+        for col, op, value, insensitive in parse_filter_query(query):
+            if col in gt:
+                mask &= _filter_mask(gt[col], op, value, insensitive)
+        rows = gt[mask]
+        
+        sort_by = [(col, direction) for col, direction in sort_by if col in rows]
+        if sort_by:
+            rows = rows.sort_values([col for col, _ in sort_by], kind="stable",
+                                    ascending=[direction == "asc" for _, direction in sort_by])
+        return rows.reset_index(drop=True)
+
+def table_page(ds_id, key, sort_by, query, page, page_size=TABLE_PAGE_SIZE):
+    """Página da tabela e total de páginas; filtros e ordenação ficam em cache"""
+    if not ds_id:
+        return [], 1
+    sort_key = tuple((s.get("column_id"), s.get("direction")) for s in sort_by or ())
+    try:
+        rows = _table_rows(ds_id, key, sort_key, query or "")
+    except LookupError:
+        return [], 1
+    
+    start = page * page_size
+    with phase("render"):
+        return rows.iloc[start:start + page_size].to_dict("records"), max(1, -(-len(rows) // page_size))
 
 def abbreviate(s: str, maxlen: int = 28) -> str:
     """Abreviação otimizada"""
@@ -422,12 +1498,722 @@ app.index_string = f'''
             {{%config%}}
             {{%scripts%}}
             {{%renderer%}}
+            <script>{UPLOAD_JS}</script>
+            <script>{CUBE_JS}</script>
         </footer>
     </body>
 </html>
 '''
 
-DF_BASE = load_local_or_sample()
+BASE_DATASET_ID = load_local_or_sample()
+BASE_DATASET = get_dataset(BASE_DATASET_ID)
+
+# -------------- Instrumentação --------------
+DASH_UPDATE_PATH = f"{app.config.routes_pathname_prefix}_dash-update-component"
+# Resolvidos na coleta: as funções de figura são definidas mais abaixo
+LRU_CACHES = {
+    "compute_view": lambda: _compute_view,
+    "dropdown_options": lambda: _dropdown_options,
+    "table_rows": lambda: _table_rows,
+    "chart_figure": lambda: chart_figure,
+}
+
+def _instrumented_name():
+    """Nome do callback (ou da rota do app) da requisição; None para as rotas do Dash"""
+    if request.path == DASH_UPDATE_PATH:
+        with phase("deserialize"):
+            body = request.get_json(silent=True) or {}
+        entry = app.callback_map.get(body.get("output"), {})
+        return getattr(entry.get("callback"), "__name__", "clientside")
+    view = server.view_functions.get(request.endpoint)
+    if view is not None and view.__module__ == __name__ and request.endpoint != "metrics":
+        return request.endpoint
+    return None
+
+# O Dash serializa a resposta do callback (to_json) dentro do dispatch: com a
+# função envolvida aqui, a fase serialize é o tempo medido dessa etapa
+def _timed_to_json(obj, _to_json=dash_callback.to_json):
+    with phase("serialize"):
+        return _to_json(obj)
+
+dash_callback.to_json = _timed_to_json
+
+@server.before_request
+def _start_timing():
+    if not METRICS_ENABLED:
+        return
+    # O nome é resolvido já com a medição ativa: o parse do corpo conta como deserialize
+    timing = _REQUEST.timing = RequestTiming("")
+    timing.name = _instrumented_name()
+    if timing.name is None:
+        _REQUEST.timing = None
+
+@server.after_request
+def _finish_timing(response):
+    timing = getattr(_REQUEST, "timing", None)
+    if timing is None:
+        return response
+    _REQUEST.timing = None
+    
+    # O que não foi atribuído a uma fase é o trabalho do Dash e do Flask em volta
+    # do callback (roteamento, validação da resposta, hooks)
+    total = time.perf_counter() - timing.start
+    phases = dict(timing.phases)
+    phases["other"] = max(0.0, total - sum(timing.phases.values()))
+    
+    name = timing.name
+    METRICS.inc("analytics_requests_total", callback=name, status=response.status_code)
+    METRICS.observe("analytics_request_seconds", total, callback=name)
+    for phase_name, seconds in phases.items():
+        METRICS.observe("analytics_request_phase_seconds", seconds, callback=name, phase=phase_name)
+    METRICS.observe("analytics_request_payload_bytes", request.content_length or 0,
+                    callback=name, direction="in")
+    METRICS.observe("analytics_request_payload_bytes", response.content_length or 0,
+                    callback=name, direction="out")
+    
+    response.headers["Server-Timing"] = ", ".join(
+        [f"{k};dur={v * 1000:.2f}" for k, v in phases.items()]
+        + [f'total;dur={total * 1000:.2f};desc="{name}"']
+    )
+    flush_metrics()
+    return response
+
+@server.teardown_request
+def _clear_timing(exc=None):
+    _REQUEST.timing = None
+
+def _collect_process_metrics() -> None:
+    """Valores lidos na hora: caches LRU e datasets deste processo"""
+    for cache, resolve in LRU_CACHES.items():
+        info = resolve().cache_info()
+        METRICS.set("analytics_cache_requests_total", info.hits, cache=cache, result="hit")
+        METRICS.set("analytics_cache_requests_total", info.misses, cache=cache, result="miss")
+        METRICS.set("analytics_cache_entries", info.currsize, cache=cache)
+    METRICS.set("analytics_cache_entries", len(DATASETS), cache="datasets")
+    METRICS.set("analytics_datasets_bytes", DATASETS.nbytes)
+
+_METRICS_FLUSH = {"at": 0.0}
+
+def flush_metrics(force: bool = False) -> None:
+    """Grava o retrato deste processo em METRICS_DIR/<pid>.json (no máximo a cada
+    METRICS_FLUSH_SECONDS, salvo force)"""
+    now = time.monotonic()
+    if not force and now - _METRICS_FLUSH["at"] < METRICS_FLUSH_SECONDS:
+        return
+    _METRICS_FLUSH["at"] = now
+    _collect_process_metrics()
+    snapshot = json.dumps(METRICS.snapshot()).encode()
+    _atomic_write(os.path.join(METRICS_DIR, f"{os.getpid()}.json"), lambda f: f.write(snapshot))
+
+def _pid_alive(pid: int) -> bool:
+    if fcntl is None:  # no Windows os.kill(pid, 0) encerraria o processo: todos contam como vivos
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+@contextmanager
+def _metrics_lock():
+    """Uma coleta por vez entre os workers (o acumulado dos encerrados é regravado)"""
+    with open(os.path.join(METRICS_DIR, ".lock"), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def collect_metrics() -> dict:
+    """Métricas somadas de todos os workers que gravaram em METRICS_DIR
+
+    Contadores e histogramas de workers encerrados (reciclados pelo gunicorn)
+    passam para ended.json, para os totais não voltarem atrás; os gauges deles
+    são descartados.
+    """
+    flush_metrics(force=True)
+    ended_path = os.path.join(METRICS_DIR, "ended.json")
+    with _metrics_lock():
+        snapshots, ended = {}, {}
+        for entry in os.scandir(METRICS_DIR):
+            stem, ext = os.path.splitext(entry.name)
+            if ext != ".json" or not stem.isdigit():
+                continue
+            try:
+                with open(entry.path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            (snapshots if _pid_alive(int(stem)) else ended)[entry.path] = snapshot
+        try:
+            with open(ended_path) as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = {}
+        if ended:
+            previous = METRICS.snapshot(METRICS.merge({"ended": previous, **ended}, gauges=False))
+            _atomic_write(ended_path, lambda f: f.write(json.dumps(previous).encode()))
+            for path in ended:
+                os.remove(path)
+    pids = {os.path.splitext(os.path.basename(path))[0]: s for path, s in snapshots.items()}
+    return METRICS.merge({**pids, "ended": previous})
+
+@server.route(f"{app.config.routes_pathname_prefix}metrics", methods=["GET"])
+def metrics():
+    """Métricas de todos os workers no formato texto do Prometheus"""
+    if not METRICS_ENABLED:
+        abort(404)
+    return server.response_class(METRICS.render(collect_metrics()), mimetype="text/plain; version=0.0.4")
+
+# Um perfil por vez no processo: o cProfile do Python 3.12 usa sys.monitoring,
+# que é global (com threads, o perfil também inclui as outras requisições)
+_PROFILE_LOCK = threading.Lock()
+
+def profile_requested() -> bool:
+    return bool(PROFILE_DIR) and "1" in (request.headers.get("X-Profile"), request.args.get("profile"))
+
+def request_filters() -> dict:
+    """Filtros da requisição (seleção, dropdowns, estado da tabela) que identificam o perfil"""
+    if request.path != DASH_UPDATE_PATH:
+        return {"setor": request.args.get("setor"), "tipos": request.args.getlist("tipo"),
+                "situacoes": request.args.getlist("situacao"), "linhas": request.args.get("linhas")}
+    body = request.get_json(silent=True) or {}
+    values = {f"{item.get('id')}.{item.get('property')}": item.get("value")
+              for item in [*body.get("inputs", []), *body.get("state", [])] if isinstance(item, dict)}
+    selection = values.get("store-selection.data") or values.get("store-filters.data")
+    if isinstance(selection, dict):
+        filters = {k: selection.get(k) for k in ("setor", "tipos", "situacoes")}
+    else:
+        filters = {"setor": values.get("dd-setor.value"), "tipos": values.get("dd-tipo.value"),
+                   "situacoes": values.get("dd-situacao.value")}
+    filters["tabela"] = values.get("store-table.data")
+    filters["topn"] = values.get("slider-topn.value")
+    return filters
+
+def save_profile(profiler, name: str, filters: dict) -> str:
+    """Grava o .prof (pstats, para snakeviz/flameprof) e um resumo .txt; devolve o .prof"""
+    filters = {k: v for k, v in filters.items() if v not in (None, "", [], {})}
+    digest = hashlib.sha1(json.dumps(filters, sort_keys=True, default=str).encode()).hexdigest()[:8]
+    # Nome legível (valores, tamanho das listas); o conteúdo completo vai no .txt
+    tag = "-".join(v if isinstance(v, str) else f"{k}{len(v)}" if isinstance(v, (list, tuple)) else f"{k}{v}"
+                   for k, v in filters.items() if not isinstance(v, dict))
+    tag = re.sub(r"[^\w.-]+", "_", tag or "todos")[:60]
+    base = os.path.join(PROFILE_DIR, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{name}-{tag}-{digest}")
+    
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(base + ".prof")
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        f.write(f"{name} {json.dumps(filters, ensure_ascii=False, default=str)}\n\n")
+        pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    return base + ".prof"
+
+def start_profile():
+    """cProfile ativo, ou None se outro perfil já estiver em andamento"""
+    if not _PROFILE_LOCK.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # outra ferramenta de profiling já ativa no processo
+        _PROFILE_LOCK.release()
+        return None
+    return profiler
+
+def stop_profile(profiler, name: str, filters: dict) -> str:
+    try:
+        profiler.disable()
+        return save_profile(profiler, name, filters)
+    finally:
+        _PROFILE_LOCK.release()
+
+@contextmanager
+def profiled(name: str, filters: dict):
+    """Perfila o bloco (fora de requisições, como os jobs de ingestão)"""
+    profiler = start_profile()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            stop_profile(profiler, name, filters)
+
+@server.before_request
+def _start_request_profile():
+    _REQUEST.profile = None
+    if not profile_requested():
+        return
+    # No upload_complete o perfil vai para o job de ingestão, não para a requisição
+    name = _instrumented_name()
+    if name is None or name == "upload_complete":
+        return
+    filters = request_filters()
+    profiler = start_profile()
+    if profiler is not None:
+        _REQUEST.profile = (profiler, name, filters)
+
+@server.after_request
+def _finish_request_profile(response):
+    profile = getattr(_REQUEST, "profile", None)
+    if profile is not None:
+        _REQUEST.profile = None
+        response.headers["X-Profile"] = os.path.basename(stop_profile(*profile))
+    return response
+
+@server.teardown_request
+def _abort_request_profile(exc=None):
+    # Requisição interrompida antes do after_request: grava o que foi perfilado
+    profile = getattr(_REQUEST, "profile", None)
+    if profile is not None:
+        _REQUEST.profile = None
+        stop_profile(*profile)
+
+# -------------- Upload em Partes --------------
+def _upload_path(upload_id: str) -> str:
+    if not UPLOAD_ID_RE.match(upload_id):
+        abort(400)
+    return _cache_path("uploads", f"{upload_id}.xlsx")
+
+def _cleanup_stale_uploads() -> None:
+    """Remove uploads e jobs abandonados há mais de UPLOAD_STALE_SECONDS"""
+    limit = time.time() - UPLOAD_STALE_SECONDS
+    for folder in (_cache_path("uploads"), _cache_path("jobs")):
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            try:
+                if os.path.getmtime(path) < limit:
+                    os.remove(path)
+            except OSError:
+                pass
+
+# Jobs de ingestão: o estado fica em disco para que qualquer worker responda
+INGEST_POOL = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+
+def _job_path(job_id: str) -> str:
+    return _cache_path("jobs", f"{job_id}.json")
+
+def _write_job(job_id: str, **state) -> None:
+    state["updated"] = time.time()
+    _atomic_write(_job_path(job_id), lambda f: f.write(json.dumps(state).encode()))
+
+def read_job(job_id: str):
+    """Estado atual de um job de ingestão (None se não existir)"""
+    try:
+        with open(_job_path(job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+class IngestJob:
+    """Job de ingestão deste processo, com batimento enquanto não termina
+
+    Uma thread regrava o último estado a cada INGEST_HEARTBEAT_SECONDS, inclusive
+    na fila, durante a leitura em paralelo e na indexação, que não publicam
+    progresso. Se o worker morre, o campo updated para de avançar.
+    """
+
+    def __init__(self, job_id: str):
+        self.id = job_id
+        self.state = {"state": "queued", "phase": "fila", "rows": 0}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        _write_job(job_id, **self.state)
+        threading.Thread(target=self._heartbeat, name="ingest-heartbeat", daemon=True).start()
+
+    def _heartbeat(self) -> None:
+        while not self._done.wait(INGEST_HEARTBEAT_SECONDS):
+            with self._lock:
+                if self._done.is_set():
+                    break
+                try:
+                    _write_job(self.id, **self.state)
+                except OSError as e:
+                    print(f"Erro ao gravar job {self.id}: {e}")
+
+    def update(self, **state) -> None:
+        with self._lock:
+            self.state = state
+            _write_job(self.id, **state)
+
+    def finish(self, **state) -> None:
+        """Estado final; o batimento para antes da gravação e nunca a sobrescreve"""
+        with self._lock:
+            self._done.set()
+            self.state = state
+            _write_job(self.id, **state)
+
+def _run_ingest_job(job: IngestJob, paths: list, all_sheets: bool, profile: bool = False) -> None:
+    last = [0.0]
+
+    def progress(phase, rows):
+        now = time.monotonic()
+        if now - last[0] >= 0.5:
+            last[0] = now
+            job.update(state="running", phase=phase, rows=rows)
+
+    try:
+        job.update(state="running", phase="leitura", rows=0)
+        start = time.perf_counter()
+        # Leitura no pool de processos (vários arquivos grandes) fica fora do perfil
+        tags = {"arquivos": len(paths), "all_sheets": all_sheets, "job": job.id}
+        with profiled("ingest_excel", tags) if profile else nullcontext():
+            ds_id = ingest_excel(paths, progress, all_sheets)
+        rows = get_dataset(ds_id).nrows
+        METRICS.observe("analytics_ingest_seconds", time.perf_counter() - start)
+        METRICS.inc("analytics_ingest_rows_total", rows)
+        job.finish(state="done", dataset_id=ds_id, rows=rows)
+    except Exception as e:
+        job.finish(state="error", error=str(e))
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+def start_ingest_job(job_id: str, paths: list, all_sheets: bool = False, profile: bool = False) -> None:
+    """Enfileira a ingestão dos arquivos recebidos; a requisição retorna na hora"""
+    INGEST_POOL.submit(_run_ingest_job, IngestJob(job_id), paths, all_sheets, profile)
+
+@server.route(f"{app.config.routes_pathname_prefix}upload/<upload_id>", methods=["GET"])
+def upload_status(upload_id):
+    """Bytes já recebidos (usado pelo cliente para retomar o envio)"""
+    path = _upload_path(upload_id)
+    return jsonify(received=os.path.getsize(path) if os.path.exists(path) else 0)
+
+@server.route(f"{app.config.routes_pathname_prefix}upload/<upload_id>", methods=["PUT"])
+def upload_chunk(upload_id):
+    """Acrescenta um bloco binário ao arquivo temporário, sem carregá-lo inteiro"""
+    path = _upload_path(upload_id)
+    offset = request.args.get("offset", 0, type=int)
+    if offset == 0:
+        _cleanup_stale_uploads()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "ab") as f:
+        size = f.tell()
+        if offset != size:
+            return jsonify(received=size), 409
+        if size + (request.content_length or 0) > UPLOAD_MAX_BYTES:
+            return jsonify(received=size, error="Arquivo excede o limite de upload"), 413
+        # Sem Content-Length (transfer-encoding chunked) o limite vale durante a
+        # cópia: um byte além do permitido descarta o bloco inteiro
+        remaining = UPLOAD_MAX_BYTES - size
+        while True:
+            block = request.stream.read(min(1 << 20, remaining + 1))
+            if not block:
+                break
+            if len(block) > remaining:
+                f.truncate(size)
+                return jsonify(received=size, error="Arquivo excede o limite de upload"), 413
+            f.write(block)
+            remaining -= len(block)
+        return jsonify(received=f.tell())
+
+@server.route(f"{app.config.routes_pathname_prefix}upload/<upload_id>/complete", methods=["POST"])
+def upload_complete(upload_id):
+    """Inicia a ingestão em segundo plano deste upload e dos demais enviados juntos
+
+    Corpo JSON opcional: {"uploads": [outros IDs], "all_sheets": bool}. Com
+    X-Profile: 1 (e PROFILE_DIR), a ingestão é perfilada.
+    """
+    body = request.get_json(silent=True) or {}
+    uploads = body.get("uploads") or [] if isinstance(body, dict) else None
+    if not isinstance(uploads, list) or not all(isinstance(u, str) for u in uploads):
+        return jsonify(error="uploads deve ser uma lista de IDs"), 400
+    others = [u for u in uploads if u != upload_id]
+    paths = [_upload_path(u) for u in [upload_id, *others]]
+    if read_job(upload_id) is not None:
+        return jsonify(job_id=upload_id), 202
+    if not all(os.path.exists(path) for path in paths):
+        return jsonify(error="Upload não encontrado"), 404
+    # Perfil pedido no complete vale para o job de ingestão em segundo plano
+    start_ingest_job(upload_id, paths, bool(body.get("all_sheets")), profile_requested())
+    return jsonify(job_id=upload_id), 202
+
+@server.route(f"{app.config.routes_pathname_prefix}upload/<upload_id>/job", methods=["GET"])
+def upload_job(upload_id):
+    """Progresso da ingestão (fase, linhas lidas) ou o ID do dataset ao final"""
+    _upload_path(upload_id)
+    job = read_job(upload_id)
+    if job is None:
+        return jsonify(error="Job não encontrado"), 404
+    if job.get("state") in ("queued", "running") and time.time() - job.get("updated", 0) > INGEST_STALE_SECONDS:
+        # Sem batimento: o worker do job morreu (timeout, restart, falta de memória)
+        job = {**job, "state": "error", "error": "Processamento interrompido no servidor; envie o arquivo novamente"}
+    return jsonify(job)
+
+# -------------- Exportação --------------
+EXPORT_FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv.gz": "application/gzip",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_CHUNK_ROWS = 65536
+XLSX_MAX_ROWS = 1048575  # limite de uma aba do Excel, sem o cabeçalho
+
+def raw_frames(dataset, setor=None, tipos=(), situacoes=(), chunk_rows=EXPORT_CHUNK_ROWS):
+    """Linhas originais filtradas, em blocos categóricos decodificados sob demanda"""
+    cube = dataset.cube
+    allowed = {}
+    for dim, values in (("Setor", [setor] if setor else []),
+                        ("Tipo", tipos), ("Situacao", situacoes)):
+        if not values:
+            continue
+        keep = np.zeros(len(dataset.labels[dim]), dtype=bool)
+        for v in values:
+            codes = cube.lookup[dim].get(str(v).lower())
+            if codes is not None:
+                keep[codes] = True
+        allowed[dim] = keep
+    
+    emitted = False
+    # Dataset vazio: uma volta com bloco vazio, para o cabeçalho e o schema
+    for start in range(0, max(dataset.nrows, 1), chunk_rows):
+        block = {dim: np.asarray(dataset.codes[dim][start:start + chunk_rows]) for dim in DIMENSIONS}
+        mask = np.ones(len(block[DIMENSIONS[0]]), dtype=bool)
+        for dim, keep in allowed.items():
+            mask &= keep[block[dim]]
+        # Sempre ao menos um bloco (mesmo vazio) para o cabeçalho e o schema
+        if mask.any() or (not emitted and start + chunk_rows >= dataset.nrows):
+            emitted = True
+            yield pd.DataFrame({
+                dim: pd.Categorical.from_codes(block[dim][mask], categories=dataset.labels[dim])
+                for dim in DIMENSIONS
+            })
+
+def stream_csv_gz(frames):
+    """CSV compactado em gzip, gerado e enviado bloco a bloco"""
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)
+    header = True
+    for df in frames:
+        data = gz.compress(df.to_csv(index=False, header=header).encode("utf-8"))
+        header = False
+        if data:
+            yield data
+    yield gz.flush()
+
+class _StreamSink(io.RawIOBase):
+    """Destino do ParquetWriter que acumula só o que ainda não foi enviado"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        self.position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def stream_parquet(frames):
+    """Parquet com um row group por bloco, enviado à medida que é escrito"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _StreamSink()
+    writer = None
+    for df in frames:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), table.schema)
+        writer.write_table(table)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+    yield sink.drain()
+
+def _rollup_rows(totals: pd.Series):
+    """Linhas (valor, quantidade) em ordem decrescente de quantidade"""
+    values = totals.to_numpy()
+    order = np.argsort(-values, kind="stable")
+    return zip(totals.index.to_numpy()[order].tolist(), values[order].tolist())
+
+def write_excel(f, frames, view, setor, tipos, situacoes) -> None:
+    """Planilha de exportação em modo write-only: as linhas vão direto para o disco"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    
+    # Aba principal
+    ws = wb.create_sheet("Dados_Filtrados")
+    total = 0
+    for i, df in enumerate(frames):
+        if i == 0:
+            ws.append(list(df.columns))
+        for row in zip(*(df[c].tolist() for c in df.columns)):
+            ws.append(row)
+        total += len(df)
+    
+    # Análises a partir dos totais já agregados na view
+    if view["total"] > 0:
+        for sheet, dim, col in (("Por_Tipo", "Tipo", "por_tipo"),
+                                ("Por_Setor", "Setor", "por_setor"),
+                                ("Por_Situacao", "Situacao", "por_situacao")):
+            ws = wb.create_sheet(sheet)
+            ws.append([dim, "Quantidade"])
+            for row in _rollup_rows(view[col]):
+                ws.append(row)
+    
+    # Metadados: o artefato é reaproveitado por todos os pedidos com a mesma
+    # chave, então a data é a da geração e os filtros são os normalizados
+    ws = wb.create_sheet("Informações")
+    ws.append(["Filtro", "Valor"])
+    ws.append(["Gerado em", datetime.now().strftime("%d/%m/%Y %H:%M")])
+    ws.append(["Setor", setor if setor else "Todos"])
+    ws.append(["Tipos", ", ".join(tipos) if tipos else "Todos"])
+    ws.append(["Situações", ", ".join(situacoes) if situacoes else "Todas"])
+    ws.append(["Total", total])
+    
+    wb.save(f)
+
+# Cache de artefatos: chave (dataset, filtros normalizados, formato, linhas)
+_EXPORT_LOCKS = [threading.Lock() for _ in range(EXPORT_LOCK_STRIPES)]
+
+def filter_labels(dataset, key: tuple) -> tuple:
+    """Filtros normalizados de volta aos rótulos do dataset, na ordem da chave
+
+    É o que a chave de exportação identifica: pedidos com outra caixa ou ordem
+    recebem o mesmo artefato e leem nele os mesmos filtros.
+    """
+    def labels(dim, values):
+        out = []
+        for v in values:
+            codes = dataset.cube.lookup[dim].get(v)
+            out.extend(dataset.labels[dim][codes].tolist() if codes is not None else [v])
+        return out
+    setor, tipos, situacoes = key
+    return (" / ".join(labels("Setor", [setor])) if setor else None,
+            labels("Tipo", tipos), labels("Situacao", situacoes))
+
+def export_key(ds_id, setor, tipos, situacoes, fmt, raw) -> str:
+    key = json.dumps([filter_key(setor, tipos, situacoes), fmt, bool(raw)])
+    return f"{ds_id}-{hashlib.sha1(key.encode()).hexdigest()[:20]}"
+
+@contextmanager
+def _export_lock(name: str):
+    """Um build por vez por faixa de chaves: Lock entre threads, flock entre workers"""
+    stripe = int(name[-4:], 16) % EXPORT_LOCK_STRIPES
+    with _EXPORT_LOCKS[stripe]:
+        if fcntl is None:
+            yield
+            return
+        with open(_cache_path("exports", f".lock-{stripe:02d}"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _open_fresh(path: str):
+    """Abre o artefato se existir e estiver dentro do TTL (None caso contrário)"""
+    try:
+        if time.time() - os.path.getmtime(path) < EXPORT_CACHE_TTL:
+            return open(path, "rb")
+    except OSError:
+        pass
+    return None
+
+def _evict_exports() -> None:
+    """Remove artefatos vencidos e, acima de EXPORT_CACHE_MAX_BYTES, os mais antigos"""
+    now = time.time()
+    entries = []
+    for entry in os.scandir(_cache_path("exports")):
+        if entry.name.startswith("."):
+            continue
+        try:
+            st = entry.stat()
+            if now - st.st_mtime >= EXPORT_CACHE_TTL:
+                os.remove(entry.path)
+            elif not entry.name.endswith(".tmp"):
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        except OSError:
+            pass
+    
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= EXPORT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+def cached_export(name: str, fmt: str, build):
+    """Artefato aberto para leitura; pedidos iguais e simultâneos esperam um único build"""
+    path = _cache_path("exports", f"{name}.{fmt}")
+    handle = _open_fresh(path)
+    if handle is not None:
+        METRICS.inc("analytics_cache_requests_total", cache="exports", result="hit")
+        return handle
+    
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _export_lock(name):
+        # Outro pedido pode ter terminado o build enquanto esperávamos
+        handle = _open_fresh(path)
+        METRICS.inc("analytics_cache_requests_total", cache="exports", result="miss" if handle is None else "hit")
+        if handle is None:
+            with phase("render"):
+                _atomic_write(path, build)
+            handle = open(path, "rb")
+            _evict_exports()
+    # O handle aberto continua válido mesmo se o arquivo for despejado durante o envio
+    return handle
+
+@server.route(f"{app.config.routes_pathname_prefix}export/<name>", methods=["GET"])
+def download_data(name):
+    ds_id, _, fmt = name.partition(".")
+    if fmt not in EXPORT_FORMATS or not DATASET_ID_RE.match(ds_id):
+        abort(404)
+    setor = request.args.get("setor") or None
+    tipos = request.args.getlist("tipo")
+    situacoes = request.args.getlist("situacao")
+    raw = request.args.get("linhas") == "1"
+    
+    view = compute_view(ds_id, setor, tipos, situacoes)
+    if view is None:
+        abort(404)
+    # Daqui em diante só os filtros normalizados: o artefato depende só da chave
+    setor, tipos, situacoes = key = filter_key(setor, tipos, situacoes)
+    if raw and fmt == "xlsx" and view["total"] > XLSX_MAX_ROWS:
+        abort(400, description="Linhas demais para uma planilha: exporte em csv.gz ou parquet")
+    
+    # Agregado da view ou linhas originais, sempre em blocos (gerados só no build)
+    if raw:
+        frames = raw_frames(get_dataset(ds_id), setor, tipos, situacoes)
+    else:
+        frames = iter([view["gt"]])
+    if fmt == "xlsx":
+        build = lambda f: write_excel(f, frames, view, *filter_labels(get_dataset(ds_id), key))
+    elif fmt == "csv.gz":
+        build = lambda f: f.writelines(stream_csv_gz(frames))
+    else:
+        build = lambda f: f.writelines(stream_parquet(frames))
+    
+    # Gerado uma vez em disco e enviado em blocos a partir do arquivo
+    name = export_key(ds_id, setor, tipos, situacoes, fmt, raw)
+    handle = cached_export(name, fmt, build)
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    response = send_file(handle, mimetype=EXPORT_FORMATS[fmt], as_attachment=True,
+                         download_name=f"processos_admin_{'linhas_' if raw else ''}{timestamp}.{fmt}",
+                         max_age=0)
+    # Tamanho conhecido pelo arquivo em disco: progresso no navegador e nas métricas
+    response.content_length = os.fstat(handle.fileno()).st_size
+    return response
 
 # -------------- Componentes --------------
 def create_loading_overlay():
@@ -468,18 +2254,15 @@ def create_sidebar():
         html.Div([
             html.H5([html.I(className="fas fa-upload me-2"), "Importar Dados"], 
                    className="mb-3 text-primary fw-bold"),
-            dcc.Upload(
-                id="upload-excel",
-                children=html.Div([
-                    html.I(className="fas fa-cloud-upload-alt fa-2x mb-2 text-primary"),
-                    html.Br(),
-                    "Arraste ou clique para selecionar",
-                    html.Br(),
-                    html.Small("Apenas .xlsx", className="text-muted")
-                ], className="upload-area"),
-                accept=".xlsx",
-                multiple=False,
-            ),
+            html.Div([
+                html.I(className="fas fa-cloud-upload-alt fa-2x mb-2 text-primary"),
+                html.Br(),
+                "Arraste ou clique para selecionar",
+                html.Br(),
+                html.Small("Um ou mais arquivos .xlsx", className="text-muted")
+            ], className="upload-area", id="upload-area"),
+            dbc.Checkbox(id="upload-all-sheets", label="Ler todas as abas compatíveis",
+                         value=False, className="mt-2"),
             html.Div(id="upload-status", className="mt-2"),
         ], className="mb-4"),
         
@@ -494,7 +2277,7 @@ def create_sidebar():
                 dbc.Label("🏢 Setor", className="fw-semibold mb-2"),
                 dcc.Dropdown(
                     id="dd-setor",
-                    options=[{"label": s, "value": s} for s in sorted(DF_BASE["Setor"].unique())] if not DF_BASE.empty else [],
+                    options=[{"label": s, "value": s} for s in BASE_DATASET.labels["Setor"]],
                     value=None,
                     placeholder="Selecione um setor",
                     clearable=True,
@@ -545,18 +2328,113 @@ def create_sidebar():
                     ], id="btn-clear", color="outline-warning", 
                        className="modern-btn w-100 mb-2")
                 ], xs=12),
+                dbc.Col([
+                    dbc.Select(
+                        id="export-format", value="xlsx",
+                        options=[
+                            {"label": "Excel (.xlsx)", "value": "xlsx"},
+                            {"label": "CSV compactado (.csv.gz)", "value": "csv.gz"},
+                            {"label": "Parquet (.parquet)", "value": "parquet"},
+                        ],
+                        className="mb-2"
+                    ),
+                    dbc.Checkbox(id="export-raw", label="Linhas originais (sem agrupar)",
+                                 value=False, className="mb-2"),
+                    dbc.Button([
+                        html.I(className="fas fa-file-export me-2"), "Exportar"
+                    ], id="btn-download", color="outline-success", href="", external_link=True,
+                       className="modern-btn w-100 mb-2")
+                ], xs=12),
                 
             ]),
         ]),
         
         # Stores
         dcc.Store(id="store-data"),
+        dcc.Store(id="store-upload"),
         dcc.Store(id="store-dark", data=False),
+        dcc.Store(id="store-templates", data={"light": CHART_TEMPLATES[False], "dark": CHART_TEMPLATES[True]}),
         dcc.Store(id="store-loading", data=False),
-        dcc.Download(id="download-excel"),
+        dcc.Store(id="store-cube"),
+        dcc.Store(id="store-selection"),
+        dcc.Store(id="store-filters"),
+        dcc.Store(id="store-table"),
         
     ], className="modern-sidebar animate-in")
 
+def create_stats():
+    """Cards de KPIs (valores preenchidos pelo servidor ou pelo modo clientside)"""
+    cards = [
+        dbc.Col([
+            html.Div([
+                html.Div("📊", style={"fontSize": "2rem", "marginBottom": "10px"}),
+                html.Div("0", id="kpi-total", className="kpi-value"),
+                html.Div("Total Processos", className="kpi-label")
+            ], className="kpi-card")
+        ], md=3, sm=6, xs=12),
+        
+        dbc.Col([
+            html.Div([
+                html.Div("🏢", style={"fontSize": "2rem", "marginBottom": "10px"}),
+                html.Div("0", id="kpi-setores", className="kpi-value"),
+                html.Div("Setores Ativos", className="kpi-label")
+            ], className="kpi-card")
+        ], md=3, sm=6, xs=12),
+        
+        dbc.Col([
+            html.Div([
+                html.Div("📋", style={"fontSize": "2rem", "marginBottom": "10px"}),
+                html.Div("0", id="kpi-tipos", className="kpi-value"),
+                html.Div("Tipos Únicos", className="kpi-label")
+            ], className="kpi-card")
+        ], md=3, sm=6, xs=12),
+        
+        dbc.Col([
+            html.Div([
+                html.Div("⭐", style={"fontSize": "2rem", "marginBottom": "10px"}),
+                html.Div("0", id="kpi-top", className="kpi-value"),
+                html.Div("Top: N/A", id="kpi-top-label", className="kpi-label")
+            ], className="kpi-card")
+        ], md=3, sm=6, xs=12),
+    ]
+    
+    return dbc.Row(cards, className="g-3 mb-4 animate-in")
+
+def create_table():
+    """Tabela agrupada por Setor, Tipo e Situação, paginada no servidor"""
+    columns = [{"name": c, "id": c} for c in ["Setor","Tipo","Situacao"]]
+    columns.append({"name": "Quantidade", "id": "Quantidade", "type": "numeric"})
+    return dash_table.DataTable(
+        id="table-processos",
+        columns=columns,
+        data=[],
+        page_current=0,
+        page_size=TABLE_PAGE_SIZE,
+        page_count=1,
+        page_action="custom",
+        sort_action="custom",
+        sort_mode="multi",
+        sort_by=[],
+        filter_action="custom",
+        filter_query="",
+        style_table={"overflowX": "auto"},
+        style_cell={
+            "padding": "12px",
+            "fontFamily": "Inter, sans-serif",
+            "fontSize": "14px",
+        },
+        style_header={
+            "fontWeight": "600",
+            "backgroundColor": COLORS["primary"],
+            "color": "white",
+            "textAlign": "left"
+        },
+        style_data_conditional=[
+            {"if": {"state": "active"}, "backgroundColor": "rgba(99, 102, 241, 0.1)"},
+            {"if": {"state": "selected"}, "backgroundColor": "rgba(99, 102, 241, 0.2)"},
+        ],
+    )
+
 def create_main_content():
     """Conteúdo principal"""
     return html.Div([
@@ -564,7 +2442,7 @@ def create_main_content():
         create_loading_overlay(),
         
         # Stats
-        html.Div(id="stats-cards", className="mb-4"),
+        html.Div([create_stats()], id="stats-cards", className="mb-4"),
         
         # Tabela
         html.Div([
@@ -575,7 +2453,7 @@ def create_main_content():
                 ], className="bg-light"),
                 dbc.CardBody([
                     html.Div(id="total-info", className="mb-3"),
-                    html.Div(id="table-content"),
+                    html.Div([create_table()], id="table-content"),
                 ])
             ], className="glass-card animate-in"),
         ], className="mb-4"),
@@ -589,7 +2467,7 @@ def create_main_content():
                             html.H6([html.I(className="fas fa-chart-pie me-2"), "Situações"], 
                                    className="mb-0 text-primary fw-bold")
                         ], className="bg-light"),
-                        dbc.CardBody([html.Div(id="chart-situacao")])
+                        dbc.CardBody([dcc.Graph(id="chart-situacao", config=GRAPH_CONFIG, style={"height": "380px"})])
                     ], className="glass-card h-100"),
                 ], md=4, className="mb-3"),
                 
@@ -599,7 +2477,7 @@ def create_main_content():
                             html.H6([html.I(className="fas fa-chart-bar me-2"), "Tipos"], 
                                    className="mb-0 text-primary fw-bold")
                         ], className="bg-light"),
-                        dbc.CardBody([html.Div(id="chart-tipos")])
+                        dbc.CardBody([dcc.Graph(id="chart-tipos", config=GRAPH_CONFIG, style={"height": "380px"})])
                     ], className="glass-card h-100"),
                 ], md=4, className="mb-3"),
                 
@@ -609,7 +2487,7 @@ def create_main_content():
                             html.H6([html.I(className="fas fa-building me-2"), "Setores"], 
                                    className="mb-0 text-primary fw-bold")
                         ], className="bg-light"),
-                        dbc.CardBody([html.Div(id="chart-setores")])
+                        dbc.CardBody([dcc.Graph(id="chart-setores", config=GRAPH_CONFIG, style={"height": "380px"})])
                     ], className="glass-card h-100"),
                 ], md=4, className="mb-3"),
             ])
@@ -627,6 +2505,126 @@ app.layout = html.Div([
     ], className="main-container", id="main-container")
 ])
 
+# -------------- Renderização --------------
+def stats_values(view):
+    """Valores dos cards de KPIs (total, setores, tipos, situação mais comum)"""
+    total = view["total"]
+    setores_count = len(view["por_setor"])
+    tipos_count = len(view["por_tipo"])
+    
+    # Situação mais comum
+    situacao_top = "N/A"
+    situacao_count = 0
+    if total > 0:
+        top_sit = view["por_situacao"].sort_values(ascending=False)
+        situacao_top = abbreviate(top_sit.index[0], 15)
+        situacao_count = top_sit.iloc[0]
+    
+    return f"{total:,}", f"{setores_count}", f"{tipos_count}", f"{situacao_count}", f"Top: {situacao_top}"
+
+def render_total(view, setor, tipos, situacoes):
+    """Alerta com o total de processos filtrados"""
+    total = view["total"]
+    
+    if total > 0:
+        return dbc.Alert([
+            html.I(className="fas fa-chart-line me-2"),
+            html.Strong(f"📈 {total:,} processos encontrados"),
+            html.Br(),
+            html.Small(f"Filtros: Setor={setor or 'Todos'} | Tipos={len(tipos)} | Situações={len(situacoes)}")
+        ], color="primary", className="mb-0")
+    else:
+        return dbc.Alert([
+            html.I(className="fas fa-search me-2"),
+            "🔍 Nenhum processo encontrado"
+        ], color="warning", className="mb-0")
+
+def chart_bars(ds_id: str, dim: str, key: tuple, topn: int):
+    """Valores e rótulos das topn barras de um gráfico (None quando não há dados)"""
+    totals = _compute_view(ds_id, *key)[CHARTS[dim][0]]
+    if totals is None or totals.empty:
+        return None
+    
+    # Mesma seleção de antes: ordem crescente e as topn primeiras
+    values = totals.to_numpy()
+    order = np.argsort(values, kind="quicksort")[:topn]
+    return values[order].tolist(), totals.index.to_numpy()[order].tolist()
+
+def empty_figure(dim: str, dark: bool):
+    """Figura vazia com a mensagem de sem dados do gráfico"""
+    hidden = {"visible": False}
+    return {
+        "data": [],
+        "layout": {
+            **CHART_LAYOUT,
+            "template": CHART_TEMPLATES[dark],
+            "xaxis": hidden,
+            "yaxis": hidden,
+            "annotations": [{"text": CHARTS[dim][2], "showarrow": False,
+                             "xref": "paper", "yref": "paper", "x": 0.5, "y": 0.5,
+                             "font": {"color": "#6c757d"}}],
+        },
+    }
+
+@lru_cache(maxsize=FIGURE_CACHE_SIZE)
+def chart_figure(ds_id: str, dim: str, key: tuple, topn: int, dark: bool):
+    """Figura de um gráfico, memoizada por (dataset, filtros, topn, tema)
+
+    Monta o dict da figura direto dos arrays, sem plotly.express nem validação.
+    """
+    with phase("render"):
+        return _chart_figure(ds_id, dim, key, topn, dark)
+
+def _chart_figure(ds_id: str, dim: str, key: tuple, topn: int, dark: bool):
+    bars = chart_bars(ds_id, dim, key, topn)
+    if bars is None:
+        return empty_figure(dim, dark)
+    x, y = bars
+    
+    return {
+        "data": [{
+            "type": "bar",
+            "orientation": "h",
+            "x": x,
+            "y": y,
+            "marker": {"color": x, "coloraxis": "coloraxis"},
+            "hovertemplate": "<b>%{y}</b><br>Qtd: %{x}<extra></extra>",
+            "name": "",
+            "showlegend": False,
+        }],
+        "layout": {
+            **CHART_LAYOUT,
+            "template": CHART_TEMPLATES[dark],
+            "xaxis": {"title": {"text": "Quantidade"}},
+            "yaxis": {"title": {"text": dim}, "categoryorder": "total ascending"},
+            "coloraxis": {"colorscale": CHART_SCALES[dim],
+                          "colorbar": {"title": {"text": "Quantidade"}}},
+        },
+    }
+
+def render_charts(ds_id, key, topn, dark):
+    """Figuras de situações, tipos (filtrados) e setores (dados completos)"""
+    # Setores usa sempre o dataset completo: a chave ignora os filtros
+    dark = bool(dark)
+    return (
+        chart_figure(ds_id, "Situacao", key, topn, dark),
+        chart_figure(ds_id, "Tipo", key, topn, dark),
+        chart_figure(ds_id, "Setor", filter_key(), topn, dark),
+    )
+
+def patch_bars(ds_id, dim, key, topn):
+    """Patch só com os arrays da barra para a nova quantidade de itens"""
+    with phase("render"):
+        bars = chart_bars(ds_id, dim, key, topn)
+    if bars is None:
+        return no_update
+    x, y = bars
+    patch = Patch()
+    patch["data"][0]["x"] = x
+    patch["data"][0]["y"] = y
+    patch["data"][0]["marker"]["color"] = x
+    return patch
+
 # -------------- Callbacks --------------
 
 # Controle de loading
@@ -641,7 +2639,7 @@ app.clientside_callback(
                 setTimeout(() => overlay.classList.remove('active'), 300);
             }
         }
-        return '';
+        return loading ? 'Processando dados...' : window.dash_clientside.no_update;
     }
     """,
     Output('loading-text', 'children'),
@@ -666,166 +2664,87 @@ def toggle_theme(n_clicks, dark):
     container_class = "main-container dark-mode" if new_dark else "main-container"
     return new_dark, theme_text, container_class
 
-# Upload e inicialização
+# Tema dos gráficos trocado no navegador, sem ida ao servidor
+app.clientside_callback(
+    """
+    function(dark, templates, ...figures) {
+        const template = templates[dark ? 'dark' : 'light'];
+        return figures.map(fig => fig
+            ? Object.assign({}, fig, {layout: Object.assign({}, fig.layout, {template: template})})
+            : window.dash_clientside.no_update);
+    }
+    """,
+    [Output("chart-situacao", "figure", allow_duplicate=True),
+     Output("chart-tipos", "figure", allow_duplicate=True),
+     Output("chart-setores", "figure", allow_duplicate=True)],
+    Input("store-dark", "data"),
+    [State("store-templates", "data"),
+     State("chart-situacao", "figure"),
+     State("chart-tipos", "figure"),
+     State("chart-setores", "figure")],
+    prevent_initial_call=True,
+)
+
+# Upload e inicialização (o arquivo chega pela rota /upload; aqui só o ID)
 @app.callback(
     [Output("store-data", "data"),
      Output("dd-setor", "options"),
-     Output("upload-status", "children")],
-    Input("upload-excel", "contents"),
-    State("upload-excel", "filename"),
+     Output("upload-status", "children"),
+     Output("store-loading", "data"),
+     Output("store-cube", "data")],
+    Input("store-upload", "data"),
     prevent_initial_call=False,
 )
-def handle_upload(contents, filename):
-    if contents is not None:
-        try:
-            df = parse_uploaded(contents)
-            status = dbc.Alert([
-                html.I(className="fas fa-check me-2"),
-                f"✅ {filename} carregado com {len(df)} registros"
-            ], color="success", dismissable=True, className="mt-2")
-        except Exception as e:
-            df = DF_BASE.copy()
-            status = dbc.Alert([
-                html.I(className="fas fa-times me-2"),
-                f"❌ Erro: {str(e)}"
-            ], color="danger", dismissable=True, className="mt-2")
+def handle_upload(upload):
+    ds_id = BASE_DATASET_ID
+    if upload and upload.get("error"):
+        status = dbc.Alert([
+            html.I(className="fas fa-times me-2"),
+            f"❌ Erro: {upload['error']}"
+        ], color="danger", dismissable=True, className="mt-2")
+    elif upload and get_dataset(upload.get("dataset_id")) is not None:
+        ds_id = upload["dataset_id"]
+        status = dbc.Alert([
+            html.I(className="fas fa-check me-2"),
+            f"✅ {upload.get('filename')} carregado com {get_dataset(ds_id).nrows} registros"
+        ], color="success", dismissable=True, className="mt-2")
+    elif upload:
+        status = dbc.Alert([
+            html.I(className="fas fa-times me-2"),
+            "❌ Erro: dataset não encontrado, envie o arquivo novamente"
+        ], color="danger", dismissable=True, className="mt-2")
     else:
-        df = DF_BASE.copy()
         status = dbc.Alert([
             html.I(className="fas fa-info me-2"),
             "📁 Dados de exemplo carregados"
         ], color="info", className="mt-2")
 
-    # Normalização
-    if not df.empty:
-        for c in ["Setor", "Tipo", "Situacao"]:
-            if c in df.columns:
-                df[c] = df[c].astype(str).str.strip()
-                df[f"{c}Cmp"] = df[c].str.lower().astype("category")
-
-    setores = sorted(df["Setor"].unique()) if "Setor" in df.columns and not df.empty else []
+    # store-data guarda apenas o ID do dataset registrado; datasets pequenos
+    # também vão como cubo compacto para o modo clientside
+    dataset = get_dataset(ds_id)
+    setores = dataset.labels["Setor"].tolist()
     return (
-        df.to_json(date_format="iso", orient="split"),
+        ds_id,
         [{"label": s, "value": s} for s in setores],
-        status
+        status,
+        False,
+        client_cube(dataset),
     )
 
-# Stats cards
-@app.callback(
-    Output("stats-cards", "children"),
-    [Input("dd-setor", "value"),
-     Input("dd-tipo", "value"),
-     Input("dd-situacao", "value")],
-    State("store-data", "data"),
-)
-def update_stats(setor, tipos, situacoes, data_json):
-    if not data_json:
-        return html.Div()
-    
-    df = pd.read_json(StringIO(data_json), orient="split")
-    df_filt = df.copy()
-    
-    # Aplicar filtros
-    if setor and "SetorCmp" in df_filt.columns:
-        df_filt = df_filt[df_filt["SetorCmp"] == str(setor).lower()]
-    if tipos and "TipoCmp" in df_filt.columns:
-        tipos_norm = [str(t).lower() for t in tipos]
-        df_filt = df_filt[df_filt["TipoCmp"].isin(tipos_norm)]
-    if situacoes and "SituacaoCmp" in df_filt.columns:
-        sits_norm = [str(s).lower() for s in situacoes]
-        df_filt = df_filt[df_filt["SituacaoCmp"].isin(sits_norm)]
-    
-    # Métricas
-    total = len(df_filt)
-    setores_count = df_filt["Setor"].nunique() if "Setor" in df_filt.columns and not df_filt.empty else 0
-    tipos_count = df_filt["Tipo"].nunique() if "Tipo" in df_filt.columns and not df_filt.empty else 0
-    
-    # Situação mais comum
-    situacao_top = "N/A"
-    situacao_count = 0
-    if not df_filt.empty and "Situacao" in df_filt.columns:
-        top_sit = df_filt["Situacao"].value_counts()
-        if len(top_sit) > 0:
-            situacao_top = abbreviate(top_sit.index[0], 15)
-            situacao_count = top_sit.iloc[0]
-    
-    cards = [
-        dbc.Col([
-            html.Div([
-                html.Div("📊", style={"fontSize": "2rem", "marginBottom": "10px"}),
-                html.Div(f"{total:,}", className="kpi-value"),
-                html.Div("Total Processos", className="kpi-label")
-            ], className="kpi-card")
-        ], md=3, sm=6, xs=12),
-        
-        dbc.Col([
-            html.Div([
-                html.Div("🏢", style={"fontSize": "2rem", "marginBottom": "10px"}),
-                html.Div(f"{setores_count}", className="kpi-value"),
-                html.Div("Setores Ativos", className="kpi-label")
-            ], className="kpi-card")
-        ], md=3, sm=6, xs=12),
-        
-        dbc.Col([
-            html.Div([
-                html.Div("📋", style={"fontSize": "2rem", "marginBottom": "10px"}),
-                html.Div(f"{tipos_count}", className="kpi-value"),
-                html.Div("Tipos Únicos", className="kpi-label")
-            ], className="kpi-card")
-        ], md=3, sm=6, xs=12),
-        
-        dbc.Col([
-            html.Div([
-                html.Div("⭐", style={"fontSize": "2rem", "marginBottom": "10px"}),
-                html.Div(f"{situacao_count}", className="kpi-value"),
-                html.Div(f"Top: {situacao_top}", className="kpi-label")
-            ], className="kpi-card")
-        ], md=3, sm=6, xs=12),
-    ]
-    
-    return dbc.Row(cards, className="g-3 mb-4 animate-in")
-
-# Filtros dependentes - Tipos
+# Filtros dependentes: só as opções do setor, servidas do cache por setor.
+# Os valores são zerados pelo roteamento, na mesma rodada da troca de setor
 @app.callback(
     [Output("dd-tipo", "options"),
-     Output("dd-tipo", "value")],
-    Input("dd-setor", "value"),
-    State("store-data", "data"),
-)
-def update_tipos(setor, data_json):
-    if not data_json:
-        return [], []
-    
-    df = pd.read_json(StringIO(data_json), orient="split")
-    
-    if setor and "SetorCmp" in df.columns and "Tipo" in df.columns:
-        tipos = df.loc[df["SetorCmp"] == str(setor).lower(), "Tipo"].dropna().unique()
-        tipos = sorted(tipos.tolist())
-    else:
-        tipos = sorted(df["Tipo"].dropna().unique().tolist()) if "Tipo" in df.columns else []
-    
-    return [{"label": t, "value": t} for t in tipos], []
-
-# Filtros dependentes - Situações
-@app.callback(
-    [Output("dd-situacao", "options"),
-     Output("dd-situacao", "value")],
-    Input("dd-setor", "value"),
-    State("store-data", "data"),
+     Output("dd-situacao", "options")],
+    [Input("dd-setor", "value"),
+     Input("store-data", "data")],
 )
-def update_situacoes(setor, data_json):
-    if not data_json:
+def update_options(setor, ds_id):
+    options = dropdown_options(ds_id, setor)
+    if options is None:
         return [], []
     
-    df = pd.read_json(StringIO(data_json), orient="split")
-    
-    if setor and "SetorCmp" in df.columns and "Situacao" in df.columns:
-        sits = df.loc[df["SetorCmp"] == str(setor).lower(), "Situacao"].dropna().unique()
-        sits = sorted(sits.tolist())
-    else:
-        sits = sorted(df["Situacao"].dropna().unique().tolist()) if "Situacao" in df.columns else []
-    
-    return [{"label": s, "value": s} for s in sits], []
+    return options
 
 # Limpar filtros
 @app.callback(
@@ -839,267 +2758,152 @@ def update_situacoes(setor, data_json):
 def clear_filters(n):
     return None, [], [], 15
 
-# Tabela principal
-@app.callback(
-    Output("table-content", "children"),
+# Roteamento dos filtros: uma seleção normalizada por ação (store-selection)
+# alimenta todas as views; com o cubo no navegador nada vai para o servidor
+app.clientside_callback(
+    ClientsideFunction(namespace="analytics", function_name="route"),
+    [Output("store-selection", "data"),
+     Output("store-filters", "data"),
+     Output("store-table", "data"),
+     Output("table-processos", "page_current"),
+     Output("dd-tipo", "value"),
+     Output("dd-situacao", "value")],
     [Input("dd-setor", "value"),
      Input("dd-tipo", "value"),
-     Input("dd-situacao", "value")],
-    State("store-data", "data"),
+     Input("dd-situacao", "value"),
+     Input("store-data", "data"),
+     Input("table-processos", "page_current"),
+     Input("table-processos", "sort_by"),
+     Input("table-processos", "filter_query"),
+     Input("store-cube", "data")],
 )
-def update_table(setor, tipos, situacoes, data_json):
-    if not data_json:
-        return html.Div("Nenhum dado disponível")
-    
-    df = pd.read_json(StringIO(data_json), orient="split")
-    df_filt = df.copy()
-    
-    # Aplicar filtros
-    tipos = tipos or []
-    situacoes = situacoes or []
-    
-    if setor and "SetorCmp" in df_filt.columns:
-        df_filt = df_filt[df_filt["SetorCmp"] == str(setor).lower()]
-    if tipos and "TipoCmp" in df_filt.columns:
-        tipos_norm = [str(t).lower() for t in tipos]
-        df_filt = df_filt[df_filt["TipoCmp"].isin(tipos_norm)]
-    if situacoes and "SituacaoCmp" in df_filt.columns:
-        sits_norm = [str(s).lower() for s in situacoes]
-        df_filt = df_filt[df_filt["SituacaoCmp"].isin(sits_norm)]
-    
-    # Agrupamento
-    if not df_filt.empty:
-        gt = df_filt.groupby(["Setor", "Tipo", "Situacao"]).size().reset_index(name="Quantidade")
-    else:
-        gt = pd.DataFrame({"Setor": [], "Tipo": [], "Situacao": [], "Quantidade": []})
-    
-    return dash_table.DataTable(
-        data=gt.to_dict("records"),
-        columns=[{"name": c, "id": c} for c in ["Setor","Tipo","Situacao","Quantidade"]],
-        page_size=15,
-        sort_action="native",
-        filter_action="native",
-        style_table={"overflowX": "auto"},
-        style_cell={
-            "padding": "12px",
-            "fontFamily": "Inter, sans-serif",
-            "fontSize": "14px",
-        },
-        style_header={
-            "fontWeight": "600",
-            "backgroundColor": COLORS["primary"],
-            "color": "white",
-            "textAlign": "left"
-        },
-        style_data_conditional=[
-            {"if": {"state": "active"}, "backgroundColor": "rgba(99, 102, 241, 0.1)"},
-            {"if": {"state": "selected"}, "backgroundColor": "rgba(99, 102, 241, 0.2)"},
-        ],
-    )
 
-# Total de processos
+# KPIs, total e tabela no modo clientside
+app.clientside_callback(
+    ClientsideFunction(namespace="analytics", function_name="summary"),
+    [Output("kpi-total", "children", allow_duplicate=True),
+     Output("kpi-setores", "children", allow_duplicate=True),
+     Output("kpi-tipos", "children", allow_duplicate=True),
+     Output("kpi-top", "children", allow_duplicate=True),
+     Output("kpi-top-label", "children", allow_duplicate=True),
+     Output("total-info", "children", allow_duplicate=True)],
+    [Input("store-selection", "data"),
+     Input("store-cube", "data")],
+    prevent_initial_call=True,
+)
+
+app.clientside_callback(
+    ClientsideFunction(namespace="analytics", function_name="table"),
+    [Output("table-processos", "data", allow_duplicate=True),
+     Output("table-processos", "page_action"),
+     Output("table-processos", "sort_action"),
+     Output("table-processos", "filter_action")],
+    [Input("store-selection", "data"),
+     Input("store-cube", "data")],
+    prevent_initial_call=True,
+)
+
+# KPIs e total no servidor (datasets sem cubo no navegador)
 @app.callback(
-    Output("total-info", "children"),
-    [Input("dd-setor", "value"),
-     Input("dd-tipo", "value"),
-     Input("dd-situacao", "value")],
-    State("store-data", "data"),
+    [Output("kpi-total", "children"),
+     Output("kpi-setores", "children"),
+     Output("kpi-tipos", "children"),
+     Output("kpi-top", "children"),
+     Output("kpi-top-label", "children"),
+     Output("total-info", "children")],
+    Input("store-filters", "data"),
 )
-def update_total(setor, tipos, situacoes, data_json):
-    if not data_json:
-        return dbc.Alert("Nenhum dado disponível", color="warning")
-    
-    df = pd.read_json(StringIO(data_json), orient="split")
-    df_filt = df.copy()
+def update_summary(filters):
+    # Sem filtros do roteamento (carga da página com o cubo no navegador): os
+    # KPIs são do callback clientside e não podem ser sobrescritos aqui
+    if filters is None:
+        return (no_update,) * 6
+    PIPELINE_RUNS["update_summary"] += 1
+    setor = filters.get("setor")
+    tipos = filters.get("tipos") or []
+    situacoes = filters.get("situacoes") or []
     
-    # Aplicar filtros
-    tipos = tipos or []
-    situacoes = situacoes or []
+    view = compute_view(filters.get("ds_id"), setor, tipos, situacoes)
+    if view is None:
+        return ("0", "0", "0", "0", "Top: N/A",
+                dbc.Alert("Nenhum dado disponível", color="warning"))
     
-    if setor and "SetorCmp" in df_filt.columns:
-        df_filt = df_filt[df_filt["SetorCmp"] == str(setor).lower()]
-    if tipos and "TipoCmp" in df_filt.columns:
-        tipos_norm = [str(t).lower() for t in tipos]
-        df_filt = df_filt[df_filt["TipoCmp"].isin(tipos_norm)]
-    if situacoes and "SituacaoCmp" in df_filt.columns:
-        sits_norm = [str(s).lower() for s in situacoes]
-        df_filt = df_filt[df_filt["SituacaoCmp"].isin(sits_norm)]
-    
-    total = len(df_filt)
-    
-    if total > 0:
-        return dbc.Alert([
-            html.I(className="fas fa-chart-line me-2"),
-            html.Strong(f"📈 {total:,} processos encontrados"),
-            html.Br(),
-            html.Small(f"Filtros: Setor={setor or 'Todos'} | Tipos={len(tipos)} | Situações={len(situacoes)}")
-        ], color="primary", className="mb-0")
-    else:
-        return dbc.Alert([
-            html.I(className="fas fa-search me-2"),
-            "🔍 Nenhum processo encontrado"
-        ], color="warning", className="mb-0")
+    with phase("render"):
+        return (*stats_values(view), render_total(view, setor, tipos, situacoes))
 
-# Gráficos
+# Tabela: só a página visível, ordenada e filtrada no servidor
 @app.callback(
-    [Output("chart-situacao", "children"),
-     Output("chart-tipos", "children"),
-     Output("chart-setores", "children")],
-    [Input("dd-setor", "value"),
-     Input("dd-tipo", "value"),
-     Input("dd-situacao", "value"),
-     Input("slider-topn", "value")],
-    [State("store-data", "data"),
+    [Output("table-processos", "data"),
+     Output("table-processos", "page_count")],
+    [Input("store-filters", "data"),
+     Input("store-table", "data")],
+)
+def update_table(filters, table):
+    if filters is None:
+        return no_update, no_update
+    PIPELINE_RUNS["update_table"] += 1
+    table = table or {}
+    key = filter_key(filters.get("setor"), filters.get("tipos"), filters.get("situacoes"))
+    return table_page(filters.get("ds_id"), key, table.get("sort_by"),
+                      table.get("filter_query"), table.get("page") or 0)
+
+# Gráficos: sempre no servidor, a partir das figuras em cache
+@app.callback(
+    [Output("chart-situacao", "figure"),
+     Output("chart-tipos", "figure"),
+     Output("chart-setores", "figure")],
+    Input("store-selection", "data"),
+    [State("slider-topn", "value"),
      State("store-dark", "data")],
 )
-def update_charts(setor, tipos, situacoes, topn, data_json, dark):
-    if not data_json:
-        empty = html.Div("Sem dados", className="text-center p-4 text-muted")
-        return empty, empty, empty
-    
-    df = pd.read_json(StringIO(data_json), orient="split")
-    df_filt = df.copy()
-    
-    # Aplicar filtros
-    tipos = tipos or []
-    situacoes = situacoes or []
+def update_charts(selection, topn, dark):
+    PIPELINE_RUNS["update_charts"] += 1
+    selection = selection or {}
+    ds_id = selection.get("ds_id")
+    if get_dataset(ds_id) is None:
+        dark = bool(dark)
+        return tuple(empty_figure(dim, dark) for dim in ("Situacao", "Tipo", "Setor"))
     
-    if setor and "SetorCmp" in df_filt.columns:
-        df_filt = df_filt[df_filt["SetorCmp"] == str(setor).lower()]
-    if tipos and "TipoCmp" in df_filt.columns:
-        tipos_norm = [str(t).lower() for t in tipos]
-        df_filt = df_filt[df_filt["TipoCmp"].isin(tipos_norm)]
-    if situacoes and "SituacaoCmp" in df_filt.columns:
-        sits_norm = [str(s).lower() for s in situacoes]
-        df_filt = df_filt[df_filt["SituacaoCmp"].isin(sits_norm)]
-    
-    # Agrupamento
-    gt = (df_filt.groupby(["Setor", "Tipo", "Situacao"]).size().reset_index(name="Quantidade")
-          if not df_filt.empty else pd.DataFrame({"Setor": [], "Tipo": [], "Situacao": [], "Quantidade": []}))
-    
-    template = "plotly_dark" if dark else "plotly_white"
-    config = {'displayModeBar': False, 'responsive': True}
-    
-    # Gráfico Situações
-    if not gt.empty:
-        gS = gt.groupby("Situacao")["Quantidade"].sum().reset_index()
-        gS = gS.sort_values("Quantidade", ascending=True).head(topn)
-        
-        figS = px.bar(gS, y="Situacao", x="Quantidade", orientation="h", 
-                     template=template, color="Quantidade", color_continuous_scale="Viridis")
-        figS.update_layout(height=380, margin=dict(l=10,r=10,t=10,b=10), showlegend=False,
-                          yaxis={"categoryorder": "total ascending"}, font=dict(family="Inter"))
-        figS.update_traces(hovertemplate="<b>%{y}</b><br>Qtd: %{x}<extra></extra>")
-        
-        chart_sit = dcc.Graph(figure=figS, config=config, style={"height": "380px"})
-    else:
-        chart_sit = html.Div("Sem dados para situações", className="text-center p-4 text-muted")
-    
-    # Gráfico Tipos
-    if not gt.empty:
-        gT = gt.groupby("Tipo")["Quantidade"].sum().reset_index()
-        gT = gT.sort_values("Quantidade", ascending=True).head(topn)
-        
-        figT = px.bar(gT, y="Tipo", x="Quantidade", orientation="h",
-                     template=template, color="Quantidade", color_continuous_scale="Plasma")
-        figT.update_layout(height=380, margin=dict(l=10,r=10,t=10,b=10), showlegend=False,
-                          yaxis={"categoryorder": "total ascending"}, font=dict(family="Inter"))
-        figT.update_traces(hovertemplate="<b>%{y}</b><br>Qtd: %{x}<extra></extra>")
-        
-        chart_tipos = dcc.Graph(figure=figT, config=config, style={"height": "380px"})
-    else:
-        chart_tipos = html.Div("Sem dados para tipos", className="text-center p-4 text-muted")
-    
-    # Gráfico Setores (dados completos)
-    if not df.empty:
-        gZ = df.groupby("Setor").size().reset_index(name="Quantidade")
-        gZ = gZ.sort_values("Quantidade", ascending=True).head(topn)
-        
-        figZ = px.bar(gZ, y="Setor", x="Quantidade", orientation="h",
-                     template=template, color="Quantidade", color_continuous_scale="Turbo")
-        figZ.update_layout(height=380, margin=dict(l=10,r=10,t=10,b=10), showlegend=False,
-                          yaxis={"categoryorder": "total ascending"}, font=dict(family="Inter"))
-        figZ.update_traces(hovertemplate="<b>%{y}</b><br>Qtd: %{x}<extra></extra>")
-        
-        chart_setores = dcc.Graph(figure=figZ, config=config, style={"height": "380px"})
-    else:
-        chart_setores = html.Div("Sem dados para setores", className="text-center p-4 text-muted")
-    
-    return chart_sit, chart_tipos, chart_setores
+    key = filter_key(selection.get("setor"), selection.get("tipos"), selection.get("situacoes"))
+    return render_charts(ds_id, key, topn, dark)
 
-# Download Excel
+# Top N: só os arrays das barras mudam, enviados como Patch. O "Limpar" também
+# volta o slider, mas aí a seleção (State) ainda é a anterior e update_charts já
+# redesenha tudo com o novo top N: btn-clear como entrada segura este callback
+# até o clear_filters terminar e permite ignorar essa rodada
 @app.callback(
-    Output("download-excel", "data"),
-    Input("btn-download", "n_clicks"),
-    [State("dd-setor", "value"),
-     State("dd-tipo", "value"),
-     State("dd-situacao", "value"),
-     State("store-data", "data")],
+    [Output("chart-situacao", "figure", allow_duplicate=True),
+     Output("chart-tipos", "figure", allow_duplicate=True),
+     Output("chart-setores", "figure", allow_duplicate=True)],
+    [Input("slider-topn", "value"),
+     Input("btn-clear", "n_clicks")],
+    State("store-selection", "data"),
     prevent_initial_call=True,
 )
-def download_data(n_clicks, setor, tipos, situacoes, data_json):
-    if not data_json:
-        return None
-    
-    df = pd.read_json(StringIO(data_json), orient="split")
-    df_filt = df.copy()
-    
-    # Aplicar filtros
-    tipos = tipos or []
-    situacoes = situacoes or []
-    
-    if setor and "SetorCmp" in df_filt.columns:
-        df_filt = df_filt[df_filt["SetorCmp"] == str(setor).lower()]
-    if tipos and "TipoCmp" in df_filt.columns:
-        tipos_norm = [str(t).lower() for t in tipos]
-        df_filt = df_filt[df_filt["TipoCmp"].isin(tipos_norm)]
-    if situacoes and "SituacaoCmp" in df_filt.columns:
-        sits_norm = [str(s).lower() for s in situacoes]
-        df_filt = df_filt[df_filt["SituacaoCmp"].isin(sits_norm)]
+def update_topn(topn, n_clear, selection):
+    if "btn-clear.n_clicks" in callback_context.triggered_prop_ids:
+        return no_update, no_update, no_update
+    PIPELINE_RUNS["update_topn"] += 1
+    selection = selection or {}
+    ds_id = selection.get("ds_id")
+    if get_dataset(ds_id) is None:
+        return no_update, no_update, no_update
     
-    # Tabela agrupada
-    gt = (df_filt.groupby(["Setor", "Tipo", "Situacao"]).size().reset_index(name="Quantidade")
-          if not df_filt.empty else pd.DataFrame({"Setor": [], "Tipo": [], "Situacao": [], "Quantidade": []}))
-    
-    # Criar Excel
-    with pd.ExcelWriter(io.BytesIO(), engine="openpyxl") as writer:
-        # Aba principal
-        gt.to_excel(writer, index=False, sheet_name="Dados_Filtrados")
-        
-        if not gt.empty:
-            # Análises
-            gt.groupby("Tipo")["Quantidade"].sum().reset_index()\
-              .sort_values("Quantidade", ascending=False)\
-              .to_excel(writer, index=False, sheet_name="Por_Tipo")
-            
-            gt.groupby("Setor")["Quantidade"].sum().reset_index()\
-              .sort_values("Quantidade", ascending=False)\
-              .to_excel(writer, index=False, sheet_name="Por_Setor")
-            
-            gt.groupby("Situacao")["Quantidade"].sum().reset_index()\
-              .sort_values("Quantidade", ascending=False)\
-              .to_excel(writer, index=False, sheet_name="Por_Situacao")
-        
-        # Metadados
-        meta = pd.DataFrame({
-            "Filtro": ["Data/Hora", "Setor", "Tipos", "Situações", "Total"],
-            "Valor": [
-                datetime.now().strftime("%d/%m/%Y %H:%M"),
-                setor if setor else "Todos",
-                ", ".join(tipos) if tipos else "Todos",
-                ", ".join(situacoes) if situacoes else "Todas",
-                len(gt)
-            ]
-        })
-        meta.to_excel(writer, index=False, sheet_name="Informações")
-        
-        writer.book.active = writer.book["Dados_Filtrados"]
-        bio = writer._handles.handle
-        bio.seek(0)
-        data = bio.read()
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    return dcc.send_bytes(lambda b: b.write(data), filename=f"processos_admin_{timestamp}.xlsx")
+    key = filter_key(selection.get("setor"), selection.get("tipos"), selection.get("situacoes"))
+    return (
+        patch_bars(ds_id, "Situacao", key, topn),
+        patch_bars(ds_id, "Tipo", key, topn),
+        patch_bars(ds_id, "Setor", filter_key(), topn),
+    )
+
+# Link de exportação acompanha os filtros, sem ida ao servidor
+app.clientside_callback(
+    ClientsideFunction(namespace="analytics", function_name="exportHref"),
+    Output("btn-download", "href"),
+    [Input("store-selection", "data"),
+     Input("export-format", "value"),
+     Input("export-raw", "value")],
+)
 
 # Executar aplicação
 if __name__ == "__main__":
@@ -0,0 +1 @@
+# Benchmarks e testes de carga do dashboard (python -m bench.run)
@@ -0,0 +1,75 @@
+# bench/clientside.py — Callbacks clientside do app executados no Node.js
+#
+# O replay dos benchmarks, do teste de carga e dos testes roda as mesmas funções
+# do CUBE_JS que o navegador (roteamento dos filtros, KPIs, tabela, link de
+# exportação), e não uma cópia em Python: um processo node carrega o script e
+# responde a uma chamada JSON por linha.
+
+import json
+import shutil
+import subprocess
+
+NO_UPDATE = object()    # window.dash_clientside.no_update
+
+SHIM = r"""
+const NO_UPDATE = {__no_update__: true};
+const window = {dash_clientside: {no_update: NO_UPDATE, callback_context: {triggered: []}}};
+const document = {getElementById: () => null};
+const lines = require('readline').createInterface({input: process.stdin});
+lines.on('line', line => {
+    const msg = JSON.parse(line);
+    let reply;
+    try {
+        if (msg.script !== undefined) {
+            new Function('window', 'document', msg.script)(window, document);
+            reply = {result: null};
+        } else {
+            window.dash_clientside.callback_context.triggered =
+                msg.triggered.map(p => ({prop_id: p, value: null}));
+            const fn = window.dash_clientside[msg.namespace][msg.function];
+            reply = {result: fn(...msg.args)};
+        }
+    } catch (err) {
+        reply = {error: String((err && err.stack) || err)};
+    }
+    process.stdout.write(JSON.stringify(reply) + '\n');
+});
+"""
+
+class ClientsideRuntime:
+    """Processo node com o script carregado; call() executa uma função de um namespace"""
+
+    def __init__(self, script: str):
+        node = shutil.which("node")
+        if node is None:
+            raise RuntimeError("Node.js (node no PATH) é necessário para executar os callbacks "
+                               "clientside do CUBE_JS; veja requirements.txt")
+        self.proc = subprocess.Popen([node, "-e", SHIM], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     text=True, encoding="utf-8")
+        self._send({"script": script})
+
+    def _send(self, msg: dict):
+        self.proc.stdin.write(json.dumps(msg) + "\n")
+        self.proc.stdin.flush()
+        reply = json.loads(self.proc.stdout.readline() or '{"error": "node encerrado"}')
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply["result"]
+
+    def call(self, namespace: str, function: str, args: list, triggered=()):
+        """Resultado da função; no_update vira NO_UPDATE (também dentro de listas de saídas)"""
+        result = self._send({"namespace": namespace, "function": function,
+                             "args": args, "triggered": sorted(triggered)})
+        unwrap = lambda v: NO_UPDATE if v == {"__no_update__": True} else v
+        return [unwrap(v) for v in result] if isinstance(result, list) else unwrap(result)
+
+    def close(self) -> None:
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=10)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,103 @@
+# bench/generate.py — Planilhas rptProcAdm.xlsx sintéticas para os benchmarks
+#
+# Mesmo formato do relatório real: 7 linhas de preâmbulo e uma em branco, o
+# cabeçalho na posição HEADER_ROW e as 10 colunas de EXPECTED_COLS. Setor, Tipo
+# e Situação têm cardinalidades assimétricas (poucos valores concentram a maior
+# parte das linhas), com uma fração de linhas vazias que a limpeza descarta.
+#
+#   python -m bench.generate 100000 rptProcAdm_100k.xlsx
+
+import argparse
+import os
+from datetime import date, timedelta
+
+import numpy as np
+
+SETORES = 40
+TIPOS = 250
+SITUACOES = 15
+BLANK_RATE = 0.01   # linhas com Setor, Tipo ou Situação vazios
+PREAMBLE = [
+    "GOVERNO DO ESTADO",
+    "SECRETARIA DE ADMINISTRAÇÃO",
+    "Sistema de Protocolo",
+    "Relatório de Processos Administrativos",
+    "Emitido em 01/01/2025",
+    "Parâmetros: todos os setores",
+    "Página 1",
+]
+HEADER = ["Descrição", None, None, None, "Interessado", "Nº Processo",
+          "Abertura", "Tipo", "Setor", "Situação"]
+
+def skewed(rng, labels, size, a):
+    """Rótulos com frequência de Zipf: o primeiro domina, a cauda é longa"""
+    ranks = np.minimum(rng.zipf(a, size), len(labels)) - 1
+    return np.asarray(labels, dtype=object)[ranks]
+
+def generate_rows(rows: int, seed: int = 0, chunk: int = 50_000):
+    """Linhas do relatório (sem preâmbulo), geradas em blocos reprodutíveis"""
+    rng = np.random.default_rng(seed)
+    setores = [f"SETOR {i:02d} - {'ARQUIVO' if i % 3 else 'PROTOCOLO'}" for i in range(SETORES)]
+    tipos = [f"TIPO {i:03d}" for i in range(TIPOS)]
+    situacoes = ["EM ANÁLISE", "CONCLUSO", "AGUARDANDO ANÁLISE", "ARQUIVADO", "EM TRÂMITE"]
+    situacoes += [f"SITUAÇÃO {i:02d}" for i in range(SITUACOES - len(situacoes))]
+    start = date(2015, 1, 1)
+
+    for offset in range(0, rows, chunk):
+        n = min(chunk, rows - offset)
+        setor = skewed(rng, setores, n, 1.6)
+        tipo = skewed(rng, tipos, n, 1.3)
+        situacao = skewed(rng, situacoes, n, 2.0)
+        # Vazios e espaços extras, como no relatório exportado pelo sistema
+        blank = rng.random(n) < BLANK_RATE
+        column = rng.integers(0, 3, n)
+        padded = rng.random(n) < 0.05
+        days = rng.integers(0, 3650, n)
+        for i in range(n):
+            values = [tipo[i], setor[i], situacao[i]]
+            if blank[i]:
+                values[column[i]] = None if column[i] else "  "
+            elif padded[i]:
+                values[1] = f" {values[1]} "
+            number = offset + i
+            yield [
+                f"Solicitação {number % 97}", None, None, None,
+                f"Interessado {number % 5003}",
+                f"{number:07d}/{2015 + days[i] // 365}",
+                start + timedelta(days=int(days[i])),
+                *values,
+            ]
+
+def generate(path: str, rows: int, seed: int = 0) -> str:
+    """Grava a planilha em modo write-only e devolve o caminho"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("rptProcAdm")
+    for line in PREAMBLE:
+        ws.append([line])
+    ws.append([])
+    ws.append(HEADER)
+    for row in generate_rows(rows, seed):
+        ws.append(row)
+
+    tmp = f"{path}.tmp"
+    wb.save(tmp)
+    os.replace(tmp, path)
+    return path
+
+def dataset_file(directory: str, rows: int, seed: int = 0) -> str:
+    """Planilha de `rows` linhas em `directory`, gerada só na primeira vez"""
+    path = os.path.join(directory, f"rptProcAdm_{rows}_s{seed}.xlsx")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        generate(path, rows, seed)
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera um rptProcAdm.xlsx sintético")
+    parser.add_argument("rows", type=int)
+    parser.add_argument("output")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate(args.output, args.rows, args.seed)
@@ -0,0 +1,440 @@
+# bench/loadtest.py — Teste de carga HTTP repetindo o tráfego de callbacks do Dash
+#
+# Grava uma sessão real contra o servidor (upload em partes, troca de setor,
+# seleção múltipla de tipos, movimentos do slider, paginação e exportação) como
+# uma sequência de requisições a /_dash-update-component e às rotas do app, e
+# depois a repete com vários usuários simultâneos. Mede p50/p95/p99, vazão e a
+# memória residente (RSS) de cada worker.
+#
+#   python -m bench.loadtest --users 8 --duration 30                 # servidor no processo
+#   python -m bench.loadtest --gunicorn 4 --users 16 --record s.jsonl
+#   python -m bench.loadtest --url http://127.0.0.1:8000 --replay s.jsonl
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+from bench.clientside import ClientsideRuntime
+from bench.generate import dataset_file
+from bench.run import DATA_DIR, INITIAL_STATE, callback_functions, callback_graph, replay
+
+UPLOAD_CHUNK = 4 * 1024 * 1024   # mesmo CHUNK_SIZE do upload no navegador
+JOB_POLL_SECONDS = 0.2
+RSS_SAMPLE_SECONDS = 0.5
+SERVER_START_TIMEOUT = 120
+
+# Ações de uma sessão gravada: propriedades alteradas (valores resolvidos a
+# partir do estado), "upload" e "export" são tratados à parte
+SESSION = [
+    ("upload", None),
+    ("setor", lambda s: {"dd-setor.value": s["dd-setor.options"][0]["value"]}),
+    ("tipos", lambda s: {"dd-tipo.value": [o["value"] for o in s["dd-tipo.options"][:1]]}),
+    ("tipos", lambda s: {"dd-tipo.value": [o["value"] for o in s["dd-tipo.options"][:2]]}),
+    ("tipos", lambda s: {"dd-tipo.value": [o["value"] for o in s["dd-tipo.options"][:3]]}),
+    ("slider", lambda s: {"slider-topn.value": 10}),
+    ("slider", lambda s: {"slider-topn.value": 25}),
+    ("slider", lambda s: {"slider-topn.value": 40}),
+    ("pagina", lambda s: {"table-processos.page_current": 1}),
+    ("export", None),
+    ("setor", lambda s: {"dd-setor.value": s["dd-setor.options"][1]["value"]}),
+    ("export", None),
+]
+
+class Client:
+    """Conexão HTTP reaproveitada entre requisições (reaberta se o servidor fechar)"""
+
+    def __init__(self, base_url: str, timeout: float = 300):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = parts.path.rstrip("/") + "/"
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method: str, path: str, body=None, headers=None) -> tuple:
+        headers = dict(headers or {})
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, self.prefix + path.lstrip("/"), body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                if response.will_close:
+                    self.close()
+                return response.status, data
+            except (http.client.RemoteDisconnected, ConnectionError, BrokenPipeError):
+                # Conexão mantida fechada pelo servidor entre duas requisições
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+# -------------- Gravação --------------
+def _prop(spec: str) -> dict:
+    component, prop = spec.split(".", 1)
+    return {"id": component, "property": prop}
+
+def callback_body(cb: dict, state: dict, triggered: set) -> dict:
+    """Corpo de /_dash-update-component como o dash-renderer envia"""
+    outputs = [_prop(p) for p in cb["output"][2:-2].split("...")] \
+        if cb["output"].startswith("..") else _prop(cb["output"])
+    return {
+        "output": cb["output"],
+        "outputs": outputs,
+        "inputs": [{**_prop(p), "value": state.get(p)} for p in cb["inputs"]],
+        "changedPropIds": sorted(triggered),
+        "state": [{**_prop(p), "value": state.get(p)} for p in cb["state"]],
+    }
+
+def callback_outputs(data: bytes) -> dict:
+    """Saídas alteradas na resposta de um callback (204: nenhuma)"""
+    if not data:
+        return {}
+    response = json.loads(data).get("response", {})
+    return {f"{component}.{prop}": value
+            for component, props in response.items() for prop, value in props.items()}
+
+def upload_file(client: Client, path: str) -> dict:
+    """Upload em partes, job de ingestão e polling, como o UPLOAD_JS; devolve o job final"""
+    upload_id = uuid.uuid4().hex
+    timings = []
+    with open(path, "rb") as f:
+        offset = 0
+        while True:
+            chunk = f.read(UPLOAD_CHUNK)
+            start = time.perf_counter()
+            status, _ = client.request("PUT", f"upload/{upload_id}?offset={offset}", chunk)
+            timings.append(("upload/put", status, time.perf_counter() - start))
+            offset += len(chunk)
+            if len(chunk) < UPLOAD_CHUNK:
+                break
+
+    start = time.perf_counter()
+    status, _ = client.request("POST", f"upload/{upload_id}/complete", {})
+    timings.append(("upload/complete", status, time.perf_counter() - start))
+    while True:
+        start = time.perf_counter()
+        status, data = client.request("GET", f"upload/{upload_id}/job")
+        timings.append(("upload/job", status, time.perf_counter() - start))
+        job = json.loads(data) if data else {}
+        if status != 200 or job.get("state") in ("done", "error"):
+            return {"job": job, "timings": timings}
+        time.sleep(JOB_POLL_SECONDS)
+
+def export_path(selection: dict, fmt: str = "xlsx") -> str:
+    """Mesmo link do analytics.exportHref para a seleção atual"""
+    params = ([("setor", selection["setor"])] if selection.get("setor") else []) \
+        + [("tipo", t) for t in selection["tipos"]] + [("situacao", s) for s in selection["situacoes"]]
+    return f"export/{selection['ds_id']}.{fmt}?{urlencode(params)}"
+
+def record_session(client: Client, graph: list, xlsx: str) -> list:
+    """Executa a sessão contra o servidor e devolve as requisições na ordem enviada"""
+    state = dict(INITIAL_STATE)
+    steps = []
+
+    def execute(cb, triggered):
+        body = callback_body(cb, state, triggered)
+        status, data = client.request("POST", "_dash-update-component", body)
+        if status not in (200, 204):
+            raise RuntimeError(f"{cb['name']}: HTTP {status} {data[:200]!r}")
+        steps.append({"action": action, "label": cb["name"], "method": "POST",
+                      "path": "_dash-update-component", "body": body})
+        return callback_outputs(data)
+
+    for action, changes in SESSION:
+        if action == "upload":
+            job = upload_file(client, xlsx)["job"]
+            if job.get("state") != "done":
+                raise RuntimeError(f"upload: {job}")
+            steps.append({"action": action, "label": "upload", "file": os.path.abspath(xlsx)})
+            changes = {"store-upload.data": {"dataset_id": job["dataset_id"], "rows": job["rows"],
+                                             "filename": os.path.basename(xlsx)}}
+            replay(graph, state, changes, execute)
+        elif action == "export":
+            path = export_path(state["store-selection.data"])
+            status, _ = client.request("GET", path)
+            if status != 200:
+                raise RuntimeError(f"export: HTTP {status}")
+            steps.append({"action": action, "label": "export", "method": "GET", "path": path})
+        else:
+            replay(graph, state, changes(state), execute)
+    return steps
+
+# -------------- Carga --------------
+def run_user(base_url: str, steps: list, deadline: float, iterations: int, results: list) -> None:
+    """Um usuário virtual: repete a sessão até o prazo ou o número de iterações"""
+    client = Client(base_url)
+    done = 0
+    try:
+        while time.monotonic() < deadline and (not iterations or done < iterations):
+            for step in steps:
+                if time.monotonic() >= deadline:
+                    break
+                start = time.perf_counter()
+                try:
+                    if "file" in step:
+                        for label, status, elapsed in upload_file(client, step["file"])["timings"]:
+                            results.append((step["action"], label, status, elapsed))
+                        continue
+                    status, _ = client.request(step["method"], step["path"], step.get("body"))
+                except (OSError, ValueError, http.client.HTTPException):
+                    # Falha de conexão conta como erro (status 0) e a sessão segue
+                    client.close()
+                    status = 0
+                results.append((step["action"], step["label"], status, time.perf_counter() - start))
+            done += 1
+    finally:
+        client.close()
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Percentil por posição mais próxima (valores já ordenados)"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+def latency_stats(values: list) -> dict:
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1] if values else 0.0,
+    }
+
+# -------------- Servidor e Memória --------------
+def rss_bytes(pid: int) -> int:
+    """Memória residente de um processo (Linux, /proc)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+def child_pids(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+class RssSampler(threading.Thread):
+    """Amostra o RSS dos workers durante a carga (pico e último valor por PID)"""
+
+    def __init__(self, pids):
+        super().__init__(daemon=True)
+        self.pids = pids    # função que devolve os PIDs atuais dos workers
+        self.peak, self.last = {}, {}
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            for pid in self.pids():
+                rss = rss_bytes(pid)
+                if rss:
+                    self.last[pid] = rss
+                    self.peak[pid] = max(rss, self.peak.get(pid, 0))
+            self.stopped.wait(RSS_SAMPLE_SECONDS)
+
+    def stop(self) -> dict:
+        self.stopped.set()
+        self.join()
+        return {str(pid): {"peak_mb": self.peak[pid] / 2**20, "last_mb": self.last[pid] / 2**20}
+                for pid in sorted(self.peak)}
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_ready(base_url: str, proc=None) -> None:
+    client = Client(base_url, timeout=5)
+    limit = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < limit:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"servidor encerrou com código {proc.returncode}")
+        try:
+            if client.request("GET", "_dash-dependencies")[0] == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            client.close()
+        time.sleep(0.5)
+    raise RuntimeError("servidor não respondeu a tempo")
+
+def start_inprocess():
+    """Servidor WSGI com threads neste processo; devolve (url, pids, stop)"""
+    from werkzeug.serving import make_server
+
+    import analytics
+
+    # Sem o log de cada requisição do servidor de desenvolvimento
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    httpd = make_server("127.0.0.1", free_port(), analytics.server, threaded=True)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{httpd.server_port}{analytics.app.config.routes_pathname_prefix}"
+    return url, lambda: [os.getpid()], httpd.shutdown
+
+def start_gunicorn(workers: int, threads: int):
+    """gunicorn local (como no Procfile, com --preload); devolve (url, pids, stop)"""
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "analytics:server", "--preload",
+         "--workers", str(workers), "--threads", str(threads),
+         "--bind", f"127.0.0.1:{port}", "--timeout", "300", "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    url = f"http://127.0.0.1:{port}/"
+    try:
+        wait_ready(url, proc)
+    except Exception:
+        proc.kill()
+        raise
+
+    def stop():
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return url, lambda: child_pids(proc.pid), stop
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Teste de carga do dashboard via HTTP")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="servidor já em execução (ex.: http://127.0.0.1:8000/)")
+    target.add_argument("--gunicorn", type=int, metavar="WORKERS", help="sobe um gunicorn local")
+    parser.add_argument("--threads", type=int, default=1, help="threads por worker do gunicorn")
+    parser.add_argument("--users", type=int, default=4, help="usuários simultâneos")
+    parser.add_argument("--duration", type=float, default=30, help="segundos de carga")
+    parser.add_argument("--iterations", type=int, default=0, help="sessões por usuário (0: até o prazo)")
+    parser.add_argument("--rows", type=int, default=100_000, help="linhas da planilha enviada")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--skip-upload", action="store_true",
+                        help="não repete o upload na carga (o dataset gravado precisa estar no servidor)")
+    parser.add_argument("--record", help="grava a sessão (JSONL) para repetir depois")
+    parser.add_argument("--replay", help="repete uma sessão gravada em vez de gravar uma nova")
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args(argv)
+
+    # Caches do app isolados por execução (servidor no processo ou gunicorn local)
+    workdir = None
+    if not args.url:
+        workdir = tempfile.mkdtemp(prefix="analytics-load-")
+        os.environ["ANALYTICS_CACHE_DIR"] = workdir
+        os.environ.pop("ANALYTICS_DATASET_DIR", None)
+
+    import analytics
+
+    stop = None
+    try:
+        if args.url:
+            url, pids = args.url, lambda: []
+        elif args.gunicorn:
+            url, pids, stop = start_gunicorn(args.gunicorn, args.threads)
+        else:
+            url, pids, stop = start_inprocess()
+            wait_ready(url)
+
+        if args.replay:
+            with open(args.replay, encoding="utf-8") as f:
+                steps = [json.loads(line) for line in f if line.strip()]
+        else:
+            client = Client(url)
+            status, data = client.request("GET", "_dash-dependencies")
+            xlsx = dataset_file(args.data_dir, args.rows)
+            print(f"gravando sessão ({args.rows} linhas)", file=sys.stderr)
+            # O roteamento dos filtros roda no navegador: o mesmo CUBE_JS, no Node.js
+            with ClientsideRuntime(analytics.CUBE_JS) as runtime:
+                graph = callback_graph(json.loads(data), callback_functions(analytics), runtime)
+                steps = record_session(client, graph, xlsx)
+            client.close()
+        if args.record:
+            with open(args.record, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(step, ensure_ascii=False) + "\n" for step in steps)
+        if args.skip_upload:
+            steps = [step for step in steps if "file" not in step]
+
+        print(f"carga: {args.users} usuários, {args.duration:.0f} s", file=sys.stderr)
+        results = []    # (ação, rótulo, status, segundos); append é seguro entre threads
+        sampler = RssSampler(pids)
+        sampler.start()
+        deadline = time.monotonic() + args.duration
+        started = time.perf_counter()
+        users = [threading.Thread(target=run_user, args=(url, steps, deadline, args.iterations, results))
+                 for _ in range(args.users)]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        elapsed = time.perf_counter() - started
+        rss = sampler.stop()
+    finally:
+        if stop is not None:
+            stop()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    by_label, by_action = {}, {}
+    for action, label, status, seconds in results:
+        by_label.setdefault(f"{action}/{label}", []).append(seconds)
+        by_action.setdefault(action, []).append(seconds)
+    errors = [r for r in results if not 200 <= r[2] < 300]
+    report = {
+        "meta": {
+            "target": "url" if args.url else f"gunicorn x{args.gunicorn}" if args.gunicorn else "inprocess",
+            "users": args.users,
+            "duration": elapsed,
+            "rows": args.rows,
+            "session_requests": len(steps),
+        },
+        "requests": len(results),
+        "errors": len(errors),
+        "throughput_rps": len(results) / elapsed if elapsed else 0.0,
+        "latency": latency_stats([r[3] for r in results]),
+        "actions": {k: latency_stats(v) for k, v in sorted(by_action.items())},
+        "callbacks": {k: latency_stats(v) for k, v in sorted(by_label.items())},
+        "rss": rss,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    total = report["latency"]
+    print(f"{report['requests']} requisições, {report['errors']} erros, "
+          f"{report['throughput_rps']:.1f} req/s | p50 {total['p50'] * 1000:.1f} ms, "
+          f"p95 {total['p95'] * 1000:.1f} ms, p99 {total['p99'] * 1000:.1f} ms", file=sys.stderr)
+    for pid, mem in rss.items():
+        print(f"worker {pid}: RSS pico {mem['peak_mb']:.0f} MB", file=sys.stderr)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
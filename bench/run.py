@@ -0,0 +1,384 @@
+# bench/run.py — Benchmarks de ingestão, callbacks e exportação
+#
+# Gera (uma vez) planilhas sintéticas em cada tamanho, mede a ingestão, repete
+# as interações do dashboard chamando os callbacks diretamente (os clientside
+# do CUBE_JS rodam no Node.js, que precisa estar no PATH) e mede as
+# exportações pela rota HTTP. O resultado sai em JSON; com --baseline, a
+# execução é comparada a um resultado anterior e falha em caso de regressão.
+#
+#   python -m bench.run --sizes 10000 100000 --output bench.json
+#   python -m bench.run --baseline bench.json --tolerance 0.25
+
+import argparse
+import contextvars
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+import cleaning
+from bench.clientside import NO_UPDATE, ClientsideRuntime
+from bench.generate import dataset_file
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DATA_DIR = os.path.join(".cache", "bench")
+MIN_DELTA = 0.005   # diferenças abaixo de 5 ms não contam como regressão
+
+# Interações repetidas em sequência, como um usuário no dashboard: propriedades
+# alteradas por ação (valores resolvidos a partir do estado atual)
+INTERACTIONS = [
+    ("upload", lambda s, ds: {"store-upload.data": {"dataset_id": ds, "filename": "rptProcAdm.xlsx"}}),
+    ("setor", lambda s, ds: {"dd-setor.value": s["dd-setor.options"][0]["value"]}),
+    ("tipos", lambda s, ds: {"dd-tipo.value": [o["value"] for o in s["dd-tipo.options"][:3]]}),
+    ("situacao", lambda s, ds: {"dd-situacao.value": [s["dd-situacao.options"][0]["value"]]}),
+    ("topn", lambda s, ds: {"slider-topn.value": 25}),
+    ("pagina", lambda s, ds: {"table-processos.page_current": 1}),
+    ("ordenacao", lambda s, ds: {"table-processos.sort_by": [{"column_id": "Quantidade", "direction": "desc"}]}),
+    ("filtro", lambda s, ds: {"table-processos.filter_query": "{Quantidade} > 1"}),
+    ("limpar", lambda s, ds: {"btn-clear.n_clicks": 1}),
+]
+INITIAL_STATE = {
+    "dd-setor.value": None,
+    "dd-tipo.value": [],
+    "dd-situacao.value": [],
+    "slider-topn.value": 15,
+    "store-dark.data": False,
+    "table-processos.page_current": 0,
+    "table-processos.sort_by": [],
+    "table-processos.filter_query": "",
+}
+# Execuções máximas por interação: cada view uma vez, no máximo um cálculo novo
+# e um único desenho dos gráficos (figura inteira ou Patch do top N)
+MAX_CALLBACK_RUNS = 1
+MAX_COMPUTE_VIEW = 1
+MAX_CHART_RENDERS = 1
+
+def timed(fn, repeat: int, setup=None) -> dict:
+    """Mediana, mínimo e máximo de `repeat` execuções (setup fora da medição)"""
+    runs = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return summarize(runs)
+
+def summarize(runs: list) -> dict:
+    return {"median": statistics.median(runs), "min": min(runs), "max": max(runs), "runs": runs}
+
+# -------------- Grafo de Callbacks --------------
+def _props(spec: str) -> list:
+    """'..a.b...c.d..' (com @hash do allow_duplicate) -> ['a.b', 'c.d']"""
+    spec = spec[2:-2] if spec.startswith("..") else spec
+    return [p.split("@")[0] for p in spec.split("...")]
+
+def callback_functions(analytics) -> dict:
+    """Especificação de saída -> função Python de cada callback do servidor"""
+    return {
+        output: getattr(analytics, entry["callback"].__name__)
+        for output, entry in analytics.app.callback_map.items() if entry.get("callback")
+    }
+
+def callback_graph(dependencies: list, functions: dict, runtime: ClientsideRuntime = None) -> list:
+    """Callbacks no formato do /_dash-dependencies, com entradas, estados e saídas
+
+    Com runtime, os callbacks clientside do namespace "analytics" (CUBE_JS)
+    rodam no Node.js; os demais clientside (scripts inline) não alteram o estado.
+    """
+    graph = []
+    for cb in dependencies:
+        clientside = cb.get("clientside_function") or {}
+        name = clientside.get("function_name")
+        func = None if name else functions.get(cb["output"])
+        entry = {
+            "name": name[:12] if name else func.__name__ if func else cb["output"],
+            "clientside": bool(name),
+            "func": func,
+            "run": None,
+            "initial": not cb.get("prevent_initial_call"),
+            "output": cb["output"],
+            "inputs": [f"{i['id']}.{i['property']}" for i in cb["inputs"]],
+            "state": [f"{s['id']}.{s['property']}" for s in cb["state"]],
+            "outputs": _props(cb["output"]),
+        }
+        if runtime is not None and clientside.get("namespace") == "analytics":
+            entry["run"] = _clientside_run(runtime, entry, clientside["namespace"], name)
+        graph.append(entry)
+    return graph
+
+def _clientside_run(runtime: ClientsideRuntime, cb: dict, namespace: str, function: str):
+    """run(state, triggered) de um callback clientside: saídas alteradas pela função JS"""
+    def run(state, triggered):
+        args = [state.get(p) for p in cb["inputs"] + cb["state"]]
+        result = runtime.call(namespace, function, args, triggered)
+        result = result if len(cb["outputs"]) > 1 else [result]
+        return {p: v for p, v in zip(cb["outputs"], result) if v is not NO_UPDATE}
+    return run
+
+def replay(graph: list, state: dict, changes: dict, execute, initial: bool = False) -> dict:
+    """Dispara os callbacks de uma ação como o dash-renderer e conta as execuções
+
+    Um callback pendente espera enquanto alguma entrada sua ainda pode ser
+    alterada por outro callback pendente (direta ou indiretamente); a saída de
+    um callback que é também sua entrada não o dispara de novo. execute(cb,
+    triggered) roda um callback do servidor e devolve as saídas alteradas; os
+    clientside do CUBE_JS rodam pelo run() montado em callback_graph. Com
+    initial, é a carga da página: todos os callbacks sem prevent_initial_call
+    ficam pendentes, sem entrada disparadora.
+    """
+    def downstream(cb, seen=None):
+        seen = seen if seen is not None else set()
+        for other in graph:
+            if other is not cb and other["name"] not in seen and set(other["inputs"]) & set(cb["outputs"]):
+                seen.add(other["name"])
+                downstream(other, seen)
+        return seen
+
+    def subsequent_outputs(cb) -> set:
+        outputs = set(cb["outputs"])
+        for name in downstream(cb):
+            outputs |= {p for other in graph if other["name"] == name for p in other["outputs"]}
+        return outputs
+
+    state.update(changes)
+    pending = {}    # nome -> (callback, propriedades que o dispararam)
+    def trigger(props, source=None):
+        for cb in graph:
+            hit = set(cb["inputs"]) & props
+            if hit and cb is not source:
+                pending.setdefault(cb["name"], (cb, set()))[1].update(hit)
+    trigger(set(changes))
+    if initial:
+        for cb in graph:
+            if cb["initial"]:
+                pending.setdefault(cb["name"], (cb, set()))
+
+    runs, timings = {}, {}
+    while pending:
+        ready = [
+            name for name, (cb, _) in pending.items()
+            if not any(set(cb["inputs"]) & subsequent_outputs(other)
+                       for other_name, (other, _) in pending.items() if other_name != name)
+        ]
+        name = (ready or list(pending))[0]
+        cb, triggered = pending.pop(name)
+        runs[name] = runs.get(name, 0) + 1
+
+        # Só os callbacks do servidor são medidos; os clientside apenas contam
+        if not cb["clientside"]:
+            start = time.perf_counter()
+            out = execute(cb, triggered)
+            timings.setdefault(name, []).append(time.perf_counter() - start)
+        elif cb["run"] is not None:
+            out = cb["run"](state, triggered)
+        else:
+            out = {}
+
+        state.update(out)
+        trigger(set(out), source=cb)
+
+    return {"runs": runs, "timings": timings}
+
+def call_callback(analytics, state: dict):
+    """execute() do replay: chama a função do callback com os valores do estado
+
+    O callback_context (triggered_prop_ids) é montado como o Dash faz em uma
+    requisição, para os callbacks que decidem pela entrada que os disparou.
+    """
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+
+    def call(cb, triggered):
+        context_value.set(AttributeDict(
+            triggered_inputs=[{"prop_id": p, "value": state.get(p)} for p in sorted(triggered)]))
+        return cb["func"](*[state.get(p) for p in cb["inputs"] + cb["state"]])
+
+    def execute(cb, triggered):
+        result = contextvars.copy_context().run(call, cb, triggered)
+        result = result if len(cb["outputs"]) > 1 else (result,)
+        return {p: v for p, v in zip(cb["outputs"], result) if v is not analytics.no_update}
+    return execute
+
+def clear_caches(analytics) -> None:
+    """Esvazia os caches em memória de views, opções, tabela e figuras"""
+    for cached in (analytics._compute_view, analytics._dropdown_options,
+                   analytics._table_rows, analytics.chart_figure):
+        cached.cache_clear()
+
+# -------------- Casos --------------
+def bench_ingest(analytics, path: str, repeat: int) -> dict:
+    def cold():
+        # Sem cache em disco nem registro: leitura, limpeza, cubo e gravação
+        for sub in ("files", "datasets"):
+            shutil.rmtree(analytics._cache_path(sub), ignore_errors=True)
+        analytics.DATASETS = analytics.DatasetRegistry(analytics.DATASET_CACHE_MAX_BYTES,
+                                                       analytics.DATASET_CACHE_MAX_ITEMS)
+
+    results = {
+        "ingest/clean_excel": timed(lambda: cleaning.clean_excel(path), repeat),
+        "ingest/ingest_excel_cold": timed(lambda: analytics.ingest_excel(path), repeat, setup=cold),
+    }
+    ds_id = analytics.ingest_excel(path)
+    results["ingest/ingest_excel_cached"] = timed(lambda: analytics.ingest_excel(path), repeat)
+    return ds_id, results
+
+def bench_callbacks(analytics, ds_id: str, repeat: int) -> tuple:
+    with ClientsideRuntime(analytics.CUBE_JS) as runtime:
+        graph = callback_graph(analytics.app._callback_list, callback_functions(analytics), runtime)
+        cold, warm, counts = {}, {}, {}
+        for attempt in range(2 * repeat):
+            # Execuções pares partem de caches vazios; as ímpares repetem a sequência
+            is_cold = attempt % 2 == 0
+            if is_cold:
+                clear_caches(analytics)
+            state = dict(INITIAL_STATE)
+            replay(graph, state, {}, call_callback(analytics, state), initial=True)
+            for name, changes in INTERACTIONS:
+                before = dict(analytics.PIPELINE_RUNS)
+                result = replay(graph, state, changes(state, ds_id), call_callback(analytics, state))
+                after = analytics.PIPELINE_RUNS
+                result["pipeline"] = {k: after[k] - before.get(k, 0) for k in after if after[k] != before.get(k, 0)}
+                target = cold if is_cold else warm
+                for cb, times in result["timings"].items():
+                    target.setdefault(f"{name}/{cb}", []).append(sum(times))
+                target.setdefault(f"{name}/total", []).append(sum(map(sum, result["timings"].values())))
+                if attempt == 0:
+                    counts[name] = {"runs": result["runs"], "pipeline": result["pipeline"]}
+
+    results = {f"callbacks/cold/{k}": summarize(v) for k, v in cold.items()}
+    results.update({f"callbacks/warm/{k}": summarize(v) for k, v in warm.items()})
+    return results, counts
+
+def bench_exports(analytics, ds_id: str, nrows: int, repeat: int) -> dict:
+    client = analytics.server.test_client()
+    dataset = analytics.get_dataset(ds_id)
+    setor = dataset.labels["Setor"][0]
+    query = urlencode({"setor": setor})
+    exports_dir = analytics._cache_path("exports")
+
+    def fetch(url):
+        response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+        response.get_data()
+        response.close()
+
+    results = {}
+    cases = [("xlsx", False), ("csv.gz", False), ("parquet", False), ("csv.gz", True), ("parquet", True)]
+    if nrows <= analytics.XLSX_MAX_ROWS:
+        cases.append(("xlsx", True))
+    for fmt, raw in cases:
+        url = f"{analytics.app.config.routes_pathname_prefix}export/{ds_id}.{fmt}?{query}"
+        url += "&linhas=1" if raw else ""
+        name = f"export/{fmt}{'/linhas' if raw else ''}"
+        results[name] = timed(lambda: fetch(url), repeat,
+                              setup=lambda: shutil.rmtree(exports_dir, ignore_errors=True))
+        results[f"{name}/cached"] = timed(lambda: fetch(url), repeat)
+    return results
+
+def check_pipeline(counts: dict) -> list:
+    """Interações que executaram alguma view ou cálculo mais de uma vez"""
+    failures = []
+    for name, count in counts.items():
+        for cb, n in count["runs"].items():
+            if n > MAX_CALLBACK_RUNS:
+                failures.append(f"{name}: {cb} executado {n} vezes")
+        if count["pipeline"].get("compute_view", 0) > MAX_COMPUTE_VIEW:
+            failures.append(f"{name}: compute_view executado {count['pipeline']['compute_view']} vezes")
+        charts = count["pipeline"].get("update_charts", 0) + count["pipeline"].get("update_topn", 0)
+        if charts > MAX_CHART_RENDERS:
+            failures.append(f"{name}: gráficos desenhados {charts} vezes")
+    return failures
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Casos cuja mediana piorou mais que a tolerância em relação ao baseline"""
+    regressions = []
+    for size, cases in results.items():
+        for name, current in cases.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if base is None:
+                continue
+            delta = current["median"] - base["median"]
+            if delta > MIN_DELTA and current["median"] > base["median"] * (1 + tolerance):
+                regressions.append(f"{size}/{name}: {base['median'] * 1000:.1f} ms -> "
+                                   f"{current['median'] * 1000:.1f} ms (+{delta / base['median']:.0%})")
+    return regressions
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks do dashboard de processos")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=5, help="execuções por callback e exportação")
+    parser.add_argument("--ingest-repeat", type=int, default=3, help="execuções por caso de ingestão")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=DATA_DIR, help="onde as planilhas geradas ficam guardadas")
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--baseline", help="resultado anterior para comparação")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="piora relativa aceita na mediana")
+    args = parser.parse_args(argv)
+
+    # Caches do app isolados por execução: a ingestão sempre parte do zero
+    workdir = tempfile.mkdtemp(prefix="analytics-bench-")
+    os.environ["ANALYTICS_CACHE_DIR"] = workdir
+    os.environ.pop("ANALYTICS_DATASET_DIR", None)
+    try:
+        import analytics
+
+        results, pipeline = {}, {}
+        for rows in args.sizes:
+            path = dataset_file(args.data_dir, rows, args.seed)
+            print(f"[{rows}] ingestão", file=sys.stderr)
+            ds_id, cases = bench_ingest(analytics, path, args.ingest_repeat)
+            nrows = analytics.get_dataset(ds_id).nrows
+            print(f"[{rows}] callbacks", file=sys.stderr)
+            callbacks, counts = bench_callbacks(analytics, ds_id, args.repeat)
+            cases.update(callbacks)
+            print(f"[{rows}] exportação", file=sys.stderr)
+            cases.update(bench_exports(analytics, ds_id, nrows, args.repeat))
+            results[str(rows)] = cases
+            pipeline[str(rows)] = counts
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "sizes": args.sizes,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": results,
+        "pipeline": pipeline,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    failures = [f"pipeline {size}: {f}" for size, counts in pipeline.items() for f in check_pipeline(counts)]
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failures += compare(results, json.load(f), args.tolerance)
+    for failure in failures:
+        print(f"FALHA {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
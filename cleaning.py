@@ -0,0 +1,166 @@
+# cleaning.py — Leitura e limpeza em streaming das planilhas rptProcAdm
+#
+# Módulo sem efeitos colaterais (não monta o app nem carrega datasets): é o que
+# os processos do pool de leitura importam ao receber read_sheets. A leitura só
+# usa numpy e openpyxl; o pandas é importado apenas ao montar o DataFrame, no
+# processo do app, então cada processo do pool não carrega nem o dashboard nem
+# o pandas.
+
+import io
+import itertools
+from array import array
+
+import numpy as np
+
+EXPECTED_COLS = [
+    "Descricao", "Col2", "Col3", "Col4", "Interessado",
+    "Nr_Processo", "Abertura", "Tipo", "Setor", "Situacao"
+]
+HEADER_ROW = 8          # posição do cabeçalho quando não é detectado pelo nome
+HEADER_SCAN_ROWS = 30   # linhas examinadas à procura do cabeçalho
+EMPTY_VALUES = {"", "nan", "none", "None"}
+PROGRESS_EVERY = 5000   # linhas entre chamadas de progress(fase, linhas)
+COLUMNS = ["Tipo", "Setor", "Situacao"]
+
+HEADER_TOKENS = ("TIPO", "SETOR", "SITUA")
+
+def _is_header(row) -> bool:
+    """Linha com as colunas de Tipo, Setor e Situação, cada uma em sua própria célula
+
+    Um título como "Processos por Tipo, Setor e Situação" tem os três nomes numa
+    célula só e não conta como cabeçalho.
+    """
+    upper = [str(v).upper() for v in row if v is not None and str(v).strip()]
+    if len(upper) < len(HEADER_TOKENS):
+        return False
+    return any(all(token in upper[i] for token, i in zip(HEADER_TOKENS, cells))
+               for cells in itertools.permutations(range(len(upper)), len(HEADER_TOKENS)))
+
+def _find_header(rows) -> tuple:
+    """Localiza a linha de cabeçalho; devolve (cabeçalho, linhas já lidas após ele)"""
+    buffered = []
+    for row in rows:
+        buffered.append(row)
+        if _is_header(row):
+            return row, []
+        if len(buffered) >= HEADER_SCAN_ROWS:
+            break
+    # Sem cabeçalho reconhecível: posição fixa do relatório (7 linhas de preâmbulo)
+    if len(buffered) <= HEADER_ROW:
+        return (), []
+    return buffered[HEADER_ROW], buffered[HEADER_ROW + 1:]
+
+def _column_positions(header, width: int) -> dict:
+    """Posição de Tipo, Setor e Situação no cabeçalho"""
+    names = [str(v) if v is not None else "" for v in header]
+    names += [""] * (width - len(names))
+    if len(names) >= 10:
+        names[:10] = EXPECTED_COLS
+
+    positions = {}
+    mappings = {"Tipo": "TIPO", "Setor": "SETOR", "Situacao": "SITUA"}
+    for target, search in mappings.items():
+        if target in names:
+            positions[target] = names.index(target)
+            continue
+        for i, name in enumerate(names):
+            if search in name.upper():
+                positions[target] = i
+                break
+    return positions
+
+def _clean_sheet(ws, progress=None, require_header=False):
+    """Tipo, Setor e Situação de uma aba, codificados por dicionário durante a leitura
+
+    Devolve {coluna: (códigos int32, rótulos)}, ou None sem as colunas esperadas.
+    """
+    # O modo read-only confia na tag <dimension> da aba, que vários geradores de
+    # relatório gravam errada ("A1"): sem ela, lê até a última linha de fato
+    ws.reset_dimensions()
+    rows = ws.iter_rows(values_only=True)
+
+    header, pending = _find_header(rows)
+    if require_header and not _is_header(header):
+        return None
+    # Largura pelo cabeçalho: após reset_dimensions, ws.max_column é None
+    positions = _column_positions(header, len(header))
+    keep = [c for c in COLUMNS if c in positions]
+    if not keep:
+        return None
+
+    # Normaliza, descarta vazios e codifica por dicionário durante a leitura:
+    # cada linha aceita vira um inteiro por coluna
+    idx = [positions[c] for c in keep]
+    out = {c: array("i") for c in keep}
+    lookup = {c: {} for c in keep}
+    for n, row in enumerate(itertools.chain(pending, rows), 1):
+        if progress and n % PROGRESS_EVERY == 0:
+            progress("leitura", n)
+        values = []
+        for i in idx:
+            v = row[i] if i < len(row) else None
+            v = "" if v is None else str(v).strip()
+            if v in EMPTY_VALUES:
+                break
+            values.append(v)
+        else:
+            for c, v in zip(keep, values):
+                codes = lookup[c]
+                code = codes.get(v)
+                if code is None:
+                    code = codes[v] = len(codes)
+                out[c].append(code)
+
+    return {c: (np.frombuffer(out[c], dtype=np.int32), list(lookup[c])) for c in keep}
+
+def piece_rows(piece: dict) -> int:
+    """Linhas de uma parte devolvida por _clean_sheet"""
+    return len(next(iter(piece.values()))[0])
+
+def concat_pieces(pieces) -> "pd.DataFrame":
+    """Junta as partes em um DataFrame categórico, unindo os rótulos sem expandir para strings"""
+    import pandas as pd
+
+    pieces = [p for p in pieces if p]
+    if not pieces:
+        return pd.DataFrame(columns=COLUMNS)
+
+    cols = [c for c in COLUMNS if any(c in p for p in pieces)]
+    data = {}
+    for c in cols:
+        # Coluna ausente em uma das partes: mesmo "N/A" do encode_dataset
+        parts = [pd.Categorical.from_codes(*p[c]) if c in p else
+                 pd.Categorical.from_codes(np.zeros(piece_rows(p), dtype=np.int8), categories=["N/A"])
+                 for p in pieces]
+        data[c] = parts[0] if len(parts) == 1 else pd.api.types.union_categoricals(parts)
+    return pd.DataFrame(data, columns=cols)
+
+def read_sheets(source, progress=None, all_sheets=False) -> list:
+    """Leitura em streaming: modo read-only, projetando só Tipo, Setor e Situação
+
+    Lê a aba rptProcAdm (ou a primeira); com all_sheets, também as demais abas
+    com cabeçalho reconhecível. progress(fase, linhas), se informado, é chamado
+    a cada PROGRESS_EVERY linhas lidas. Devolve as partes de cada aba, sem pandas.
+    """
+    from openpyxl import load_workbook
+
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        primary = "rptProcAdm" if "rptProcAdm" in wb.sheetnames else wb.sheetnames[0]
+        names = [primary] + ([n for n in wb.sheetnames if n != primary] if all_sheets else [])
+        pieces, done = [], 0
+        for name in names:
+            sheet_progress = progress and (lambda phase, n, base=done: progress(phase, base + n))
+            piece = _clean_sheet(wb[name], sheet_progress, require_header=name != primary)
+            if piece is not None:
+                pieces.append(piece)
+                done += piece_rows(piece)
+    finally:
+        wb.close()
+    return pieces
+
+def clean_excel(source, progress=None, all_sheets=False) -> "pd.DataFrame":
+    """Planilha limpa em um DataFrame categórico (ver read_sheets)"""
+    return concat_pieces(read_sheets(source, progress, all_sheets))
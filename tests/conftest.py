@@ -0,0 +1,12 @@
+# tests/conftest.py — Ambiente isolado para importar o app nos testes
+#
+# O cache em disco (datasets, exportações, uploads) vai para um diretório
+# temporário, e a raiz do repositório entra no sys.path.
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("ANALYTICS_CACHE_DIR", tempfile.mkdtemp(prefix="analytics-tests-"))
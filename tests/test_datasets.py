@@ -0,0 +1,75 @@
+# tests/test_datasets.py — Datasets persistidos em disco e orçamento de espaço
+
+import os
+import time
+
+import pandas as pd
+
+import analytics
+
+def frame(n: int) -> pd.DataFrame:
+    return pd.DataFrame({"Setor": [f"SETOR {i % 7}" for i in range(n)],
+                         "Tipo": [f"TIPO {i % 11}" for i in range(n)],
+                         "Situacao": ["CONCLUSO"] * n})
+
+def on_disk(ds_id: str) -> bool:
+    return os.path.exists(os.path.join(analytics._dataset_dir(ds_id), "meta.json"))
+
+def test_size_cap_keeps_base_and_registered(monkeypatch):
+    # Registro com um item: os datasets anteriores deixam de estar registrados
+    monkeypatch.setattr(analytics, "DATASETS", analytics.DatasetRegistry(1 << 30, 1))
+    monkeypatch.setattr(analytics, "DATASET_DISK_MAX_BYTES", 1)
+    old = [analytics.register_dataset(frame(n)) for n in (1001, 1002)]
+    latest = analytics.register_dataset(frame(1003))
+
+    assert not any(on_disk(ds_id) for ds_id in old)
+    assert on_disk(latest)
+    assert on_disk(analytics.BASE_DATASET_ID)
+
+def test_age_limit_removes_unused_datasets(monkeypatch):
+    monkeypatch.setattr(analytics, "DATASETS", analytics.DatasetRegistry(1 << 30, 1))
+    stale = analytics.register_dataset(frame(2001))
+    used = analytics.register_dataset(frame(2002))
+    past = time.time() - analytics.DATASET_DISK_TTL - 1
+    for ds_id in (stale, used, analytics.BASE_DATASET_ID):
+        os.utime(analytics._dataset_dir(ds_id), (past, past))
+
+    analytics._evict_datasets()
+    assert not on_disk(stale)
+    assert on_disk(used)
+    assert on_disk(analytics.BASE_DATASET_ID)
+    assert analytics.get_dataset(stale) is None
+
+def unregistered_id(df: pd.DataFrame) -> str:
+    return analytics.dataset_id(*analytics.encode_dataset(df))
+
+def test_missing_dataset_is_not_cached():
+    # Consultado antes de existir (ou depois de removido do disco): a falta não
+    # pode ficar memoizada quando o mesmo conteúdo é registrado de novo
+    df = frame(3001)
+    ds_id = unregistered_id(df)
+    assert analytics.compute_view(ds_id) is None
+    assert analytics.register_dataset(df) == ds_id
+    assert analytics.compute_view(ds_id)["total"] == 3001
+
+def test_missing_dataset_options_are_not_cached():
+    df = frame(3002)
+    ds_id = unregistered_id(df)
+    assert analytics.dropdown_options(ds_id) is None
+    analytics.register_dataset(df)
+    tipos, situacoes = analytics.dropdown_options(ds_id)
+    assert len(tipos) == 11 and [o["value"] for o in situacoes] == ["CONCLUSO"]
+
+def test_cube_mask_matches_direct_filter():
+    # Bitmaps montados por código: o filtro pelo cubo bate com o filtro direto nas linhas
+    df = frame(500)
+    df.loc[::3, "Tipo"] = df.loc[::3, "Tipo"].str.lower()
+    codes, labels = {}, {}
+    for dim in analytics.DIMENSIONS:
+        cat = df[dim].astype("category")
+        codes[dim], labels[dim] = cat.cat.codes.to_numpy(), cat.cat.categories.to_numpy(dtype=object)
+    cube = analytics.CountCube.from_codes(codes, labels)
+    rows = df[(df["Setor"] == "SETOR 3") & df["Tipo"].str.lower().isin(["tipo 2", "tipo 5"])]
+    mask = cube.mask(setor="SETOR 3", tipos=["TIPO 2", "tipo 5"])
+    assert cube.counts[mask].sum() == len(rows)
+    assert cube.totals("Tipo", mask).sum() == len(rows)
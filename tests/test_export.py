@@ -0,0 +1,133 @@
+# tests/test_export.py — Rota de exportação e cache de artefatos em disco
+
+import io
+import os
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import analytics
+
+PREFIX = analytics.app.config.routes_pathname_prefix
+
+SOURCE = pd.DataFrame({
+    "Setor": [f"SETOR {i % 3}" for i in range(600)],
+    "Tipo": [f"TIPO {i % 7}" for i in range(600)],
+    "Situacao": ["CONCLUSO" if i % 4 else "EM ANÁLISE" for i in range(600)],
+})
+
+@pytest.fixture(scope="module")
+def ds_id():
+    return analytics.register_dataset(SOURCE)
+
+def fetch(ds_id: str, fmt: str, query: str = "") -> bytes:
+    response = analytics.server.test_client().get(f"{PREFIX}export/{ds_id}.{fmt}?{query}")
+    assert response.status_code == 200
+    return response.get_data()
+
+def read_export(data: bytes, fmt: str) -> pd.DataFrame:
+    if fmt == "parquet":
+        return pd.read_parquet(io.BytesIO(data))
+    if fmt == "xlsx":
+        return pd.read_excel(io.BytesIO(data), sheet_name="Dados_Filtrados")
+    return pd.read_csv(io.BytesIO(data), compression="gzip")
+
+def sorted_rows(df: pd.DataFrame) -> list:
+    return sorted(map(tuple, df.astype(str).to_numpy().tolist()))
+
+FILTERED = "setor=SETOR 1&tipo=TIPO 2&tipo=TIPO 5&situacao=CONCLUSO"
+
+def expected_rows() -> pd.DataFrame:
+    return SOURCE[(SOURCE["Setor"] == "SETOR 1") & SOURCE["Tipo"].isin(["TIPO 2", "TIPO 5"])
+                  & (SOURCE["Situacao"] == "CONCLUSO")]
+
+@pytest.mark.parametrize("fmt", ["xlsx", "csv.gz", "parquet"])
+def test_filtered_export_round_trip(ds_id, fmt):
+    rows = expected_rows()
+    assert len(rows) > 0
+    raw = read_export(fetch(ds_id, fmt, FILTERED + "&linhas=1"), fmt)
+    assert list(raw.columns) == analytics.DIMENSIONS
+    assert sorted_rows(raw) == sorted_rows(rows[analytics.DIMENSIONS])
+
+    grouped = read_export(fetch(ds_id, fmt, FILTERED), fmt)
+    expected = rows.groupby(analytics.DIMENSIONS).size().reset_index(name="Quantidade")
+    assert list(grouped.columns) == analytics.DIMENSIONS + ["Quantidade"]
+    assert sorted_rows(grouped) == sorted_rows(expected)
+
+@pytest.mark.parametrize("fmt", ["parquet", "csv.gz"])
+def test_empty_raw_export_keeps_columns(fmt):
+    empty = pd.DataFrame({dim: pd.Series([], dtype=object) for dim in analytics.DIMENSIONS})
+    ds_id = analytics.register_dataset(empty)
+    df = read_export(fetch(ds_id, fmt, "linhas=1"), fmt)
+    assert list(df.columns) == analytics.DIMENSIONS and len(df) == 0
+
+def test_xlsx_info_matches_cache_key(ds_id):
+    # Caixa e ordem diferentes: mesmo artefato, com os filtros normalizados e a data da geração
+    from openpyxl import load_workbook
+
+    first = fetch(ds_id, "xlsx", "setor=setor 1&tipo=TIPO 2&tipo=tipo 0")
+    second = fetch(ds_id, "xlsx", "setor=SETOR 1&tipo=tipo 0&tipo=Tipo 2")
+    assert first == second
+    info = dict(load_workbook(io.BytesIO(first), read_only=True)["Informações"].iter_rows(values_only=True))
+    assert info["Setor"] == "SETOR 1"
+    assert info["Tipos"] == "TIPO 0, TIPO 2"
+    assert "Gerado em" in info and "Data/Hora" not in info
+
+def counting_build(calls: list, payload: bytes = b"x" * 100, delay: float = 0.0):
+    def build(f):
+        calls.append(threading.get_ident())
+        time.sleep(delay)
+        f.write(payload)
+    return build
+
+def test_export_cache_hit_builds_once(ds_id):
+    calls = []
+    name = analytics.export_key(ds_id, "hit", (), (), "csv.gz", False)
+    for _ in range(3):
+        with analytics.cached_export(name, "csv.gz", counting_build(calls)) as handle:
+            assert handle.read() == b"x" * 100
+    assert len(calls) == 1
+
+def test_concurrent_exports_share_one_build(ds_id):
+    # Pedidos iguais e simultâneos esperam o build em andamento
+    calls, sizes = [], []
+    name = analytics.export_key(ds_id, "coalesce", (), (), "csv.gz", False)
+    def request():
+        with analytics.cached_export(name, "csv.gz", counting_build(calls, delay=0.2)) as handle:
+            sizes.append(len(handle.read()))
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and sizes == [100] * 4
+
+def test_expired_export_is_rebuilt_and_evicted(ds_id):
+    calls = []
+    name = analytics.export_key(ds_id, "ttl", (), (), "csv.gz", False)
+    path = analytics._cache_path("exports", f"{name}.csv.gz")
+    analytics.cached_export(name, "csv.gz", counting_build(calls)).close()
+    old = time.time() - analytics.EXPORT_CACHE_TTL - 1
+    os.utime(path, (old, old))
+    analytics.cached_export(name, "csv.gz", counting_build(calls)).close()
+    assert len(calls) == 2
+
+    os.utime(path, (old, old))
+    analytics._evict_exports()
+    assert not os.path.exists(path)
+
+def test_size_cap_evicts_oldest_exports(monkeypatch, ds_id):
+    monkeypatch.setattr(analytics, "EXPORT_CACHE_MAX_BYTES", 250)
+    for entry in os.scandir(analytics._cache_path("exports")):
+        if not entry.name.startswith("."):
+            os.remove(entry.path)
+    paths, now = [], time.time()
+    for i in range(3):
+        name = analytics.export_key(ds_id, f"size{i}", (), (), "csv.gz", False)
+        paths.append(analytics._cache_path("exports", f"{name}.csv.gz"))
+        analytics.cached_export(name, "csv.gz", counting_build([])).close()
+        os.utime(paths[-1], (now - 30 + i, now - 30 + i))
+    analytics._evict_exports()
+    assert [os.path.exists(p) for p in paths] == [False, True, True]
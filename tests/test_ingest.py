@@ -0,0 +1,84 @@
+# tests/test_ingest.py — Leitura em streaming das planilhas rptProcAdm
+
+import os
+import re
+import subprocess
+import sys
+import zipfile
+
+import pytest
+from openpyxl import Workbook
+
+import cleaning
+
+PREAMBLE = ["GOVERNO DO ESTADO", "Relatório de Processos Administrativos"] + [None] * 5
+HEADER = ["Descrição", None, None, None, "Interessado", "Nº Processo",
+          "Abertura", "Tipo", "Setor", "Situação"]
+
+def write_report(path, rows: int, dimension: str = None, preamble=PREAMBLE) -> str:
+    """Relatório com preâmbulo e cabeçalho; dimension regrava a tag <dimension>"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "rptProcAdm"
+    for line in preamble:
+        ws.append([line])
+    ws.append([])
+    ws.append(HEADER)
+    for i in range(rows):
+        ws.append([f"Solicitação {i}", None, None, None, "Fulano", f"{i:07d}/2024",
+                   "01/01/2024", f"TIPO {i % 3}", f"SETOR {i % 2}", "EM ANÁLISE"])
+    wb.save(path)
+    if dimension is None:
+        return str(path)
+
+    with zipfile.ZipFile(path) as zin:
+        items = [(item, zin.read(item.filename)) for item in zin.infolist()]
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zout:
+        for item, data in items:
+            if item.filename.startswith("xl/worksheets/"):
+                data = re.sub(rb'<dimension ref="[^"]*"', f'<dimension ref="{dimension}"'.encode(), data)
+            zout.writestr(item, data)
+    return str(path)
+
+def test_clean_excel_reads_header_and_columns(tmp_path):
+    df = cleaning.clean_excel(write_report(tmp_path / "rpt.xlsx", 300))
+    assert list(df.columns) == ["Tipo", "Setor", "Situacao"]
+    assert len(df) == 300
+    assert df["Setor"].value_counts().to_dict() == {"SETOR 0": 150, "SETOR 1": 150}
+
+def test_title_naming_columns_is_not_header(tmp_path):
+    # O título cita Tipo, Setor e Situação numa célula só: o cabeçalho é a linha de colunas
+    preamble = ["GOVERNO DO ESTADO", "Relatório de processos por Tipo, Setor e Situação"] + PREAMBLE[2:]
+    df = cleaning.clean_excel(write_report(tmp_path / "rpt.xlsx", 60, preamble=preamble))
+    assert len(df) == 60
+    assert set(df["Tipo"]) == {"TIPO 0", "TIPO 1", "TIPO 2"}
+    assert set(df["Setor"]) == {"SETOR 0", "SETOR 1"}
+
+@pytest.mark.parametrize("dimension", ["A1", "A1:C5"])
+def test_clean_excel_ignores_wrong_dimension_tag(tmp_path, dimension):
+    # Geradores de relatório gravam <dimension ref="A1">; o modo read-only não
+    # pode confiar nela e devolver um dataset vazio
+    path = write_report(tmp_path / "rpt.xlsx", 3000, dimension)
+    with zipfile.ZipFile(path) as z:
+        assert f'<dimension ref="{dimension}"'.encode() in z.read("xl/worksheets/sheet1.xml")
+    df = cleaning.clean_excel(path)
+    assert len(df) == 3000
+    assert df["Tipo"].nunique() == 3
+
+def test_read_sheets_stays_light(tmp_path):
+    # É o que os processos do pool executam: nem o app nem o pandas são importados
+    path = write_report(tmp_path / "rpt.xlsx", 50)
+    code = ("import sys, cleaning; pieces = cleaning.read_sheets(sys.argv[1]); "
+            "assert cleaning.piece_rows(pieces[0]) == 50; "
+            "assert 'pandas' not in sys.modules and 'analytics' not in sys.modules")
+    subprocess.run([sys.executable, "-c", code, path], check=True, cwd=os.path.dirname(cleaning.__file__))
+
+def test_clean_parallel_matches_serial(tmp_path):
+    import analytics
+
+    paths = [write_report(tmp_path / f"rpt{i}.xlsx", n) for i, n in enumerate((120, 80))]
+    serial = cleaning.concat_pieces([p for path in paths for p in cleaning.read_sheets(path)])
+    parallel = analytics.clean_parallel(paths)
+    assert len(parallel) == 200
+    for column in cleaning.COLUMNS:
+        assert parallel[column].astype(str).tolist() == serial[column].astype(str).tolist()
@@ -0,0 +1,96 @@
+# tests/test_metrics.py — Rota /metrics e cabeçalho Server-Timing
+
+import json
+import os
+import re
+import subprocess
+import sys
+
+import analytics
+
+PREFIX = analytics.app.config.routes_pathname_prefix
+SAMPLE_RE = re.compile(r'^(?P<name>[a-z_]+)(?:\{(?P<labels>[a-z_]+="[^"]*"(?:,[a-z_]+="[^"]*")*)\})? (?P<value>\S+)$')
+
+def update_options(client):
+    """Chamada do callback update_options como o dash-renderer faz"""
+    return client.post(f"{PREFIX}_dash-update-component", json={
+        "output": "..dd-tipo.options...dd-situacao.options..",
+        "outputs": [{"id": "dd-tipo", "property": "options"}, {"id": "dd-situacao", "property": "options"}],
+        "inputs": [{"id": "dd-setor", "property": "value", "value": None},
+                   {"id": "store-data", "property": "data", "value": analytics.BASE_DATASET_ID}],
+        "changedPropIds": ["store-data.data"],
+        "state": [],
+    })
+
+def worker_snapshot(requests: int, entries: int) -> dict:
+    """Retrato gravado por um worker em METRICS_DIR/<pid>.json"""
+    buckets = [0] * (len(analytics.LATENCY_BUCKETS) + 1)
+    buckets[4] = 1
+    return {
+        "analytics_requests_total": [[[["callback", "update_charts"], ["status", 200]], requests]],
+        "analytics_request_seconds": [[[["callback", "update_charts"]], [buckets, 0.02]]],
+        "analytics_cache_entries": [[[["cache", "compute_view"]], entries]],
+    }
+
+def sample(text: str, series: str) -> float:
+    values = [line.rsplit(" ", 1)[1] for line in text.splitlines() if line.startswith(series + " ")]
+    assert len(values) == 1, series
+    return float(values[0])
+
+def test_metrics_sum_workers_and_keep_ended_counts(monkeypatch, tmp_path):
+    monkeypatch.setattr(analytics, "METRICS_DIR", str(tmp_path))
+    ended = subprocess.Popen([sys.executable, "-c", "pass"])
+    ended.wait()
+    (tmp_path / f"{os.getppid()}.json").write_text(json.dumps(worker_snapshot(3, 7)))
+    (tmp_path / f"{ended.pid}.json").write_text(json.dumps(worker_snapshot(5, 11)))
+
+    client = analytics.server.test_client()
+    for _ in range(2):
+        text = client.get(f"{PREFIX}metrics").get_data(as_text=True)
+        series = 'analytics_requests_total{callback="update_charts",status="200"}'
+        assert sample(text, series) == 8
+        assert sample(text, 'analytics_request_seconds_count{callback="update_charts"}') == 2
+        # Gauges por processo; os do worker encerrado são descartados
+        assert sample(text, f'analytics_cache_entries{{cache="compute_view",pid="{os.getppid()}"}}') == 7
+        assert f'pid="{ended.pid}"' not in text
+    assert not (tmp_path / f"{ended.pid}.json").exists()
+    assert (tmp_path / "ended.json").exists()
+
+def test_server_timing_header():
+    response = update_options(analytics.server.test_client())
+    assert response.status_code == 200
+    entries = dict(item.split(";", 1) for item in response.headers["Server-Timing"].split(", "))
+    assert {"deserialize", "serialize", "other", "total"} <= set(entries)
+    durations = {k: float(re.match(r"dur=([\d.]+)", v)[1]) for k, v in entries.items()}
+    assert entries["total"].endswith('desc="update_options"')
+    assert durations["serialize"] > 0
+    assert sum(v for k, v in durations.items() if k != "total") <= durations["total"] + 0.05
+
+def test_metrics_text_format(monkeypatch, tmp_path):
+    monkeypatch.setattr(analytics, "METRICS_DIR", str(tmp_path))
+    client = analytics.server.test_client()
+    update_options(client)
+    response = client.get(f"{PREFIX}metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+
+    families, samples = {}, []
+    for line in response.get_data(as_text=True).splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            families[name] = kind
+        elif not line.startswith("# HELP "):
+            m = SAMPLE_RE.match(line)
+            assert m, line
+            samples.append((m["name"], m["labels"] or "", float(m["value"])))
+    assert families["analytics_requests_total"] == "counter"
+    assert families["analytics_request_seconds"] == "histogram"
+    for name, _, _ in samples:
+        assert re.sub(r"_(bucket|sum|count)$", "", name) in families
+
+    # Histograma: buckets acumulados, o +Inf igual à contagem
+    labels = 'callback="update_options"'
+    buckets = [v for n, l, v in samples if n == "analytics_request_seconds_bucket" and l.startswith(labels)]
+    count = [v for n, l, v in samples if n == "analytics_request_seconds_count" and l == labels]
+    assert buckets == sorted(buckets) and count == [buckets[-1]] and count[0] >= 1
+    assert any(n == "analytics_requests_total" and l == labels + ',status="200"' for n, l, _ in samples)
@@ -0,0 +1,90 @@
+# tests/test_pipeline.py — Execuções do pipeline por interação do dashboard
+#
+# As interações do benchmark são repetidas sobre o grafo de callbacks do app,
+# com os callbacks do servidor chamados como no Dash e os do CUBE_JS rodando no
+# Node.js: cada interação calcula cada view e desenha os gráficos uma vez só.
+
+import shutil
+
+import pandas as pd
+import pytest
+
+import analytics
+from bench import run
+from bench.clientside import NO_UPDATE, ClientsideRuntime
+from bench.generate import generate_rows
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("node") is None,
+    reason="Node.js não encontrado (node fora do PATH): necessário para executar o CUBE_JS "
+           "dos callbacks clientside; veja requirements.txt")
+
+@pytest.fixture(scope="module")
+def ds_id():
+    rows = list(generate_rows(3000, seed=1))
+    return analytics.register_dataset(pd.DataFrame({
+        "Tipo": [r[7] for r in rows], "Setor": [r[8] for r in rows], "Situacao": [r[9] for r in rows],
+    }))
+
+@pytest.fixture(scope="module")
+def runtime():
+    with ClientsideRuntime(analytics.CUBE_JS) as runtime:
+        yield runtime
+
+@pytest.mark.parametrize("max_cells", [0, analytics.CLIENTSIDE_MAX_CELLS], ids=["servidor", "clientside"])
+def test_each_interaction_computes_views_once(monkeypatch, ds_id, max_cells):
+    monkeypatch.setattr(analytics, "CLIENTSIDE_MAX_CELLS", max_cells)
+    run.clear_caches(analytics)
+    _, counts = run.bench_callbacks(analytics, ds_id, repeat=1)
+
+    assert list(counts) == [name for name, _ in run.INTERACTIONS]
+    assert run.check_pipeline(counts) == []
+    # Trocar setor zera tipos e situações no roteamento, sem nova rodada de views
+    assert counts["setor"]["runs"]["route"] == 1
+    server = counts["setor"]["pipeline"]
+    assert server.get("update_summary", 0) == server.get("update_table", 0) == (0 if max_cells else 1)
+    # "Limpar" redesenha os gráficos uma vez, sem o Patch do top N com a seleção antiga
+    assert counts["limpar"]["pipeline"].get("update_charts") == 1
+    assert counts["limpar"]["pipeline"].get("update_topn", 0) == 0
+    assert counts["topn"]["pipeline"] == {"update_topn": 1}
+
+def test_route_resets_dependent_filters(runtime, ds_id):
+    args = ["SETOR 01 - ARQUIVO", ["TIPO 001"], ["CONCLUSO"], ds_id, 3, [], "", None]
+    selection, filters, table, page, tipos, situacoes = runtime.call(
+        "analytics", "route", args, {"dd-setor.value"})
+    assert tipos == situacoes == []
+    assert selection == filters == {"ds_id": ds_id, "setor": "SETOR 01 - ARQUIVO",
+                                    "tipos": [], "situacoes": []}
+    assert table == {"page": 0, "sort_by": [], "filter_query": ""} and page == 0
+
+    # Só a página mudou: nenhuma seleção nova, a tabela segue na página pedida
+    selection, filters, table, page, tipos, situacoes = runtime.call(
+        "analytics", "route", args, {"table-processos.page_current"})
+    assert selection is filters is page is tipos is NO_UPDATE
+    assert table["page"] == 3
+
+@pytest.mark.parametrize("max_cells", [0, analytics.CLIENTSIDE_MAX_CELLS], ids=["servidor", "clientside"])
+def test_page_load_keeps_clientside_views(monkeypatch, runtime, max_cells):
+    # Na carga da página os KPIs e a tabela do servidor também disparam, ainda sem
+    # filtros: com o cubo no navegador, não podem sobrescrever o que o clientside mostrou
+    monkeypatch.setattr(analytics, "CLIENTSIDE_MAX_CELLS", max_cells)
+    graph = run.callback_graph(analytics.app._callback_list, run.callback_functions(analytics), runtime)
+    state = dict(run.INITIAL_STATE)
+    execute = run.call_callback(analytics, state)
+    written = {}
+    def record(cb, triggered):
+        out = execute(cb, triggered)
+        written.update(dict.fromkeys(out, cb["name"]))
+        return out
+
+    result = run.replay(graph, state, {}, record, initial=True)
+    assert all(n == 1 for n in result["runs"].values())
+    assert state["store-data.data"] == analytics.BASE_DATASET_ID
+    server = {p for p, name in written.items() if name in ("update_summary", "update_table")}
+    if max_cells:
+        assert server == set()
+        assert isinstance(state["total-info.children"], dict)   # alerta montado no CUBE_JS
+    else:
+        assert {"kpi-total.children", "total-info.children", "table-processos.data"} <= server
+    nrows = analytics.get_dataset(analytics.BASE_DATASET_ID).nrows
+    assert state["kpi-total.children"].replace(",", "").replace(".", "") == str(nrows)
@@ -0,0 +1,46 @@
+# tests/test_profile.py — Perfil sob demanda (PROFILE_DIR e X-Profile)
+
+import os
+import pstats
+
+import pytest
+
+import analytics
+
+PREFIX = analytics.app.config.routes_pathname_prefix
+
+def export(headers=None, query="setor=SETOR"):
+    return analytics.server.test_client().get(
+        f"{PREFIX}export/{analytics.BASE_DATASET_ID}.csv.gz?{query}", headers=headers or {})
+
+@pytest.mark.parametrize("headers, query", [({"X-Profile": "1"}, "setor=SETOR"), (None, "setor=SETOR&profile=1")],
+                         ids=["cabecalho", "parametro"])
+def test_profiled_request_writes_prof_and_summary(monkeypatch, tmp_path, headers, query):
+    monkeypatch.setattr(analytics, "PROFILE_DIR", str(tmp_path))
+    response = export(headers, query)
+    assert response.status_code == 200
+    prof = tmp_path / response.headers["X-Profile"]
+    assert prof.suffix == ".prof" and "download_data" in prof.name
+
+    # .prof legível pelo pstats (snakeviz, flameprof) e resumo .txt com os filtros
+    assert pstats.Stats(str(prof)).total_calls > 0
+    summary = prof.with_suffix(".txt").read_text(encoding="utf-8")
+    assert summary.startswith('download_data {"setor": "SETOR"')
+    assert "cumulative" in summary
+    assert sorted(p.suffix for p in tmp_path.iterdir()) == [".prof", ".txt"]
+
+def test_profiler_off_without_profile_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(analytics, "PROFILE_DIR", None)
+    monkeypatch.chdir(tmp_path)
+    response = export(headers={"X-Profile": "1"}, query="setor=SETOR&profile=1")
+    assert response.status_code == 200
+    assert "X-Profile" not in response.headers
+    assert os.listdir(tmp_path) == []
+
+def test_profiled_block_writes_files(monkeypatch, tmp_path):
+    # Jobs de ingestão são perfilados fora da requisição
+    monkeypatch.setattr(analytics, "PROFILE_DIR", str(tmp_path))
+    with analytics.profiled("ingest_excel", {"arquivos": 1}):
+        sum(range(1000))
+    names = sorted(p.name for p in tmp_path.iterdir())
+    assert len(names) == 2 and all("-ingest_excel-" in n for n in names)
@@ -0,0 +1,37 @@
+# tests/test_table.py — filter_query da tabela paginada no servidor
+
+import pandas as pd
+import pytest
+
+import analytics
+
+@pytest.mark.parametrize("query, expected", [
+    ("{Quantidade} > 5", [("Quantidade", "gt", "5", False)]),
+    ("{Quantidade} s> 5", [("Quantidade", "gt", "5", False)]),
+    ("{Quantidade} s>= 5", [("Quantidade", "ge", "5", False)]),
+    ("{Quantidade} i< 5", [("Quantidade", "lt", "5", True)]),
+    ("{Setor} i= arquivo", [("Setor", "eq", "arquivo", True)]),
+    ("{Setor} s!= ARQUIVO", [("Setor", "ne", "ARQUIVO", False)]),
+    ("{Setor} icontains srh", [("Setor", "contains", "srh", True)]),
+    ("{Tipo} scontains \"CTC\" && {Quantidade} i>= 2",
+     [("Tipo", "contains", "CTC", False), ("Quantidade", "ge", "2", True)]),
+])
+def test_parse_filter_query(query, expected):
+    assert analytics.parse_filter_query(query) == expected
+
+def test_prefixed_operator_filters_rows():
+    key = analytics.filter_key()
+    everything, _ = analytics.table_page(analytics.BASE_DATASET_ID, key, (), "", 0, page_size=100)
+    plain, _ = analytics.table_page(analytics.BASE_DATASET_ID, key, (), "{Quantidade} > 1", 0, page_size=100)
+    prefixed, _ = analytics.table_page(analytics.BASE_DATASET_ID, key, (), "{Quantidade} s> 1", 0, page_size=100)
+    assert prefixed == plain
+    assert len(prefixed) < len(everything)
+
+def test_missing_dataset_page_is_not_cached():
+    df = pd.DataFrame({"Setor": ["A", "B", "B"], "Tipo": ["X", "Y", "Z"], "Situacao": ["S", "S", "T"]})
+    ds_id = analytics.dataset_id(*analytics.encode_dataset(df))
+    key = analytics.filter_key()
+    assert analytics.table_page(ds_id, key, (), "", 0) == ([], 1)
+    analytics.register_dataset(df)
+    rows, pages = analytics.table_page(ds_id, key, (), "", 0)
+    assert len(rows) == 3 and pages == 1
@@ -0,0 +1,61 @@
+# tests/test_upload.py — Rota de upload em partes e jobs de ingestão
+
+import io
+import json
+import os
+import time
+import uuid
+
+import pytest
+
+import analytics
+
+PREFIX = analytics.app.config.routes_pathname_prefix
+# Corpo sem Content-Length, como o gunicorn entrega um upload chunked
+CHUNKED = {"Transfer-Encoding": "chunked"}
+TERMINATED = {"wsgi.input_terminated": True}
+
+@pytest.fixture
+def client():
+    return analytics.server.test_client()
+
+def test_complete_rejects_non_string_uploads(client):
+    upload_id = uuid.uuid4().hex
+    for body in ({"uploads": [123]}, {"uploads": "abc"}, [upload_id]):
+        response = client.post(f"{PREFIX}upload/{upload_id}/complete", json=body)
+        assert response.status_code == 400
+
+def test_chunked_upload_respects_limit(client, monkeypatch):
+    monkeypatch.setattr(analytics, "UPLOAD_MAX_BYTES", 1000)
+    upload_id = uuid.uuid4().hex
+    url = f"{PREFIX}upload/{upload_id}?offset=0"
+    # Sem Content-Length: o limite só pode ser aplicado durante a cópia
+    response = client.put(url, input_stream=io.BytesIO(b"x" * 1500),
+                          headers=CHUNKED, environ_overrides=TERMINATED)
+    assert response.status_code == 413
+    assert client.get(f"{PREFIX}upload/{upload_id}").get_json() == {"received": 0}
+
+    response = client.put(url, input_stream=io.BytesIO(b"x" * 800),
+                          headers=CHUNKED, environ_overrides=TERMINATED)
+    assert response.status_code == 200
+    assert response.get_json() == {"received": 800}
+
+def test_heartbeat_keeps_job_fresh_until_finished(monkeypatch):
+    monkeypatch.setattr(analytics, "INGEST_HEARTBEAT_SECONDS", 0.05)
+    job = analytics.IngestJob(uuid.uuid4().hex)
+    first = analytics.read_job(job.id)["updated"]
+    time.sleep(0.3)
+    assert analytics.read_job(job.id)["updated"] > first
+
+    job.finish(state="done", dataset_id="x", rows=1)
+    time.sleep(0.2)
+    assert analytics.read_job(job.id)["state"] == "done"
+
+def test_job_without_heartbeat_is_reported_as_error(client):
+    upload_id = uuid.uuid4().hex
+    os.makedirs(os.path.dirname(analytics._job_path(upload_id)), exist_ok=True)
+    with open(analytics._job_path(upload_id), "w") as f:
+        json.dump({"state": "running", "phase": "leitura", "rows": 10,
+                   "updated": time.time() - analytics.INGEST_STALE_SECONDS - 1}, f)
+    job = client.get(f"{PREFIX}upload/{upload_id}/job").get_json()
+    assert job["state"] == "error"